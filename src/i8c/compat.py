@@ -31,11 +31,15 @@ if sys.version_info < (3,):
     next = lambda i: i.next()
     join_bytes = lambda seq: "".join(c.decode("iso-8859-1")
                                      for c in seq).encode("iso-8859-1")
+    from StringIO import StringIO
+    memory_view = lambda obj, start, limit: buffer(obj, start, limit - start)
 else:
     str = str
     integer = (int,)
     next = next
     join_bytes = bytes
+    from io import StringIO
+    memory_view = lambda obj, start, limit: memoryview(obj)[start:limit]
 
 def fprint(file, text=""):
     fwrite(file, text + "\n")
@@ -29,6 +29,9 @@ from .context import Context
 from .testcase import TestCase
 import sys
 
+if sys.version_info >= (3, 5):
+    from .asynccontext import AsyncContext
+
 if sys.version_info < (3,):
     str = unicode
 
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Execution Environment.
+#
+# The Infinity Note Execution Environment is free software; you can
+# redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation;
+# either version 2.1 of the License, or (at your option) any later
+# version.
+#
+# The Infinity Note Execution Environment is distributed in the hope
+# that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with the Infinity Note Execution Environment; if not,
+# see <http://www.gnu.org/licenses/>.
+
+
+"""Execution of functions against asynchronous environments.
+
+This module uses syntax which was added in Python 3.5, and is only
+imported by i8c.runtime on versions of Python which support it.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from .. import constants
+from . import *
+from .context import Context
+from .functions import BytecodeFunction
+from .verifier import DEREF_OPS
+import inspect
+import struct
+
+class AsyncContext(Context):
+    """A context whose environment's hooks may be coroutines.
+
+    The environment's read_memory, lookup_symbol and call_PROVIDER_NAME
+    methods may return awaitables, and call is a coroutine which
+    awaits them as execution reaches them, so many calls may be in
+    progress at once on one event loop.  Functions are always
+    interpreted: they are not translated into Python, and the call
+    cache and read cache are not used.
+    """
+
+    def pycode_for(self, function):
+        return None
+
+    async def call(self, signature, *args, **kwargs):
+        """Call the function with signature SIGNATURE, returning a
+        list of its results.  See Context.call for the keyword
+        arguments accepted."""
+        function, stack, limits = self.new_call(signature, args, kwargs)
+        if isinstance(function, BytecodeFunction):
+            callee_stack = self.acquire_stack()
+            stack.pop_multi_onto(reversed(function.ptypes), callee_stack)
+            await self.__interpret(function, callee_stack, limits)
+            callee_stack.pop_multi_onto(function.rtypes, stack)
+            self.release_stack(callee_stack)
+        else:
+            await self.__call_builtin(function, stack)
+        return stack.pop_multi(function.rtypes)
+
+    async def call_many(self, signature, argument_rows, **kwargs):
+        """Call the same function for every argument tuple in
+        ARGUMENT_ROWS, one after another, returning a list of result
+        lists.  Keyword arguments are as for call, and apply to each
+        call."""
+        results = []
+        for args in argument_rows:
+            results.append(await self.call(signature, *args, **kwargs))
+        return results
+
+    async def __call_builtin(self, function, stack):
+        result = function.impl(*function.pop_arguments(stack))
+        if inspect.isawaitable(result):
+            result = await result
+        function.push_results(self, stack, result)
+
+    async def __deref(self, op, address):
+        fmt = op.deref_format(self)
+        try:
+            result = self.env.read_memory(fmt, address)
+            if inspect.isawaitable(result):
+                result = await result
+        except KeyError as e:
+            raise BadDerefError(op, self.env.memory, e.args[0])
+        return struct.unpack(fmt, result)[0]
+
+    async def __lookup_address(self, op):
+        exception = None
+        for name in op.src[1:].symbol_names:
+            try:
+                result = self.env.lookup_symbol(name)
+                if inspect.isawaitable(result):
+                    result = await result
+                return result
+            except KeyError as e:
+                exception = e
+        assert exception is not None
+        raise exception
+
+    async def __interpret(self, function, stack, limits):
+        """Interpret FUNCTION with its arguments on STACK.  This is
+        BytecodeFunction's interpreter loop, except that operations
+        which use the environment are performed here so that they
+        may be awaited, and tail calls are not optimized."""
+        hooks = self.operation_hooks
+        depth_limit = self.call_depth_limit
+        frames = []
+        pc, op, count = 0, None, 0
+        while True:
+            ops, externals = function.ops, function.externals
+            return_pc = len(function.bytecode)
+            checked = function.verification is None
+            max_stack = function.max_stack if checked else None
+            callee = None
+            while pc != return_pc:
+                op = ops[pc]
+                for hook in hooks:
+                    hook(self, op, stack)
+                if limits is not None:
+                    count += 1
+                    if count == limits.BATCH:
+                        limits.consume(count, op)
+                        count = 0
+                opcode = op.opcode
+                if opcode in DEREF_OPS:
+                    address = stack.pop_unsigned()
+                    stack.push_intptr(await self.__deref(op, address))
+                    pc_adjust = None
+                elif opcode == constants.DW_OP_addr:
+                    stack.push_intptr(await self.__lookup_address(op))
+                    pc_adjust = None
+                elif opcode == constants.I8_OP_call:
+                    callee = stack.pop_function()
+                    for hook in self.call_hooks:
+                        hook(self, callee, stack)
+                    if isinstance(callee, BytecodeFunction):
+                        pc += op.size
+                        break
+                    await self.__call_builtin(callee, stack)
+                    callee = pc_adjust = None
+                else:
+                    pc_adjust = op.impl(self, externals, stack)
+                pc += op.size
+                if max_stack is not None and len(stack.slots) > max_stack:
+                    raise StackOverflowError(op.src, max_stack)
+                if pc_adjust is not None:
+                    pc += pc_adjust
+                    if checked and pc != return_pc and pc not in ops:
+                        raise BadJumpError(op)
+
+            if callee is not None:
+                if len(frames) == depth_limit:
+                    raise ExecutionLimitError(
+                        op, "call depth limit (%d) exceeded" % depth_limit)
+                frames.append((function, pc, stack))
+                caller_stack, stack = stack, self.acquire_stack()
+                caller_stack.pop_multi_onto(reversed(callee.ptypes), stack)
+                function, pc = callee, 0
+                continue
+
+            if max_stack is not None and len(stack.slots) > max_stack:
+                raise StackOverflowError(function.bytecode, max_stack)
+            for hook in self.return_hooks:
+                hook(self, function, stack)
+            if not frames:
+                break
+            callee, callee_stack = function, stack
+            function, pc, stack = frames.pop()
+            callee_stack.pop_multi_onto(callee.rtypes, stack)
+            self.release_stack(callee_stack)
+        if count:
+            limits.consume(count, op)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Execution Environment.
+#
+# The Infinity Note Execution Environment is free software; you can
+# redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation;
+# either version 2.1 of the License, or (at your option) any later
+# version.
+#
+# The Infinity Note Execution Environment is distributed in the hope
+# that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with the Infinity Note Execution Environment; if not,
+# see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+
+class CallCache(object):
+    """A bounded cache of the results of pure function calls.
+
+    Install one by setting Context.call_cache.  Calls to functions
+    the context determines are pure are looked up by signature and
+    arguments, and the least recently used entry is discarded when
+    the cache holds more than MAXSIZE entries.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def invalidate(self):
+        """Discard all cached results."""
+        self.__entries.clear()
+
+    def key(self, function, stack):
+        """Return the key under which the results of calling
+        FUNCTION with the arguments on STACK are cached."""
+        slots = stack.slots
+        return (function.signature,
+                tuple(slots[len(slots) - len(function.ptypes):]))
+
+    def get(self, key):
+        """Return the cached results for KEY, deepest first, or None
+        if there are none."""
+        results = self.__entries.pop(key, None)
+        if results is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__entries[key] = results
+        return results
+
+    def put(self, key, results):
+        """Cache RESULTS, deepest first, under KEY."""
+        self.__entries[key] = tuple(results)
+        if len(self.__entries) > self.maxsize:
+            self.__entries.popitem(last=False)
+
+    def execute(self, ctx, function, stack):
+        """Execute FUNCTION, taking its arguments from STACK and
+        pushing its results onto it, using a cached result if
+        possible."""
+        key = self.key(function, stack)
+        results = self.get(key)
+        slots = stack.slots
+        if results is not None:
+            del slots[len(slots) - len(function.ptypes):]
+            slots.extend(results)
+            return
+        function.execute(ctx, stack)
+        self.put(key, slots[len(slots) - len(function.rtypes):])
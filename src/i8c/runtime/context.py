@@ -23,21 +23,51 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from ..compat import fprint, str
+from ..compat import str
 from . import *
 from . import elffile
 from . import functions
+from . import hooks
+from . import limits
+from . import notecache
+from . import noteindex
+from . import profiler
 from . import stack
-import sys
+from . import vector
+import multiprocessing
+import os
+import time
+
+# The keyword arguments accepted by Context.call.
+CALL_KEYWORDS = ("budget", "deadline")
 
 class Context(object):
     def __init__(self):
         self.functions = {}
+        self.read_cache = None
         self.env = None
+        self.call_budget = None
+        self.call_timeout = None
+        self.call_depth = 0
+        self.call_depth_limit = 10000
+        self.translated_depth = 0
+        self.translated_depth_limit = 50
+        self.limits = None
         self.wordsize = None
         self.byteorder = None
-        self.tracelevel = 0
-        self.__last_traced = None
+        self.translate_notes = False
+        self.lazy_notes = False
+        self.call_cache = None
+        self.note_cache = None
+        self.search_path = []
+        self.note_index = None
+        self.__purity = {}
+        self.__hooks = []
+        self.__update_hooks()
+        self.__tracer = None
+        self.__profiler = None
+        self.__stack_pool = []
+        self.__indexed_files = {}
 
     # Methods to XXX
 
@@ -46,6 +76,10 @@ class Context(object):
         if not funclist:
             self.functions[function.signature] = funclist
         funclist.append(function)
+        self.__unlink()
+        self.__purity.clear()
+        if self.call_cache is not None:
+            self.call_cache.invalidate()
 
     def get_function(self, sig_or_ref):
         if isinstance(sig_or_ref, functions.UnresolvedFunction):
@@ -64,6 +98,9 @@ class Context(object):
                 return funclist[0]
             elif len(funclist) > 1:
                 raise AmbiguousFunctionError(sig_or_ref)
+        # Load any notes defining it from the search path
+        if self.__load_indexed(signature):
+            return self.get_function(sig_or_ref)
         # No registered function with this name
         if reference is not None:
             impl = "call_%s_%s" % (reference.provider, reference.name)
@@ -72,9 +109,143 @@ class Context(object):
                 return functions.BuiltinFunction(reference, impl)
         raise UndefinedFunctionError(sig_or_ref)
 
+    # Methods to bind externals to the functions they reference
+
+    @property
+    def env(self):
+        return self.__env
+
+    @env.setter
+    def env(self, env):
+        # Builtin functions are looked up in the environment.
+        self.__env = env
+        self.__unlink()
+        if self.read_cache is not None:
+            self.read_cache.invalidate()
+
+    def __unlink(self):
+        self.__links = {}
+
+    def link(self):
+        """Bind every external of every registered function to the
+        function it references, so they need not be looked up when
+        executed.  Externals which cannot be resolved are left
+        unbound, and will raise the usual exceptions if executed.
+        Links are discarded when functions are registered or the
+        environment changes."""
+        for funclist in self.functions.values():
+            for function in funclist:
+                for extern in getattr(function, "externals", ()):
+                    try:
+                        self.resolve_external(extern)
+                    except FunctionLookupError:
+                        pass
+
+    def resolve_external(self, extern):
+        """Return (type, function) for the external EXTERN."""
+        try:
+            return self.__links[extern]
+        except KeyError:
+            result = self.__links[extern] = extern.resolve(self)
+            return result
+
     # Methods to XXX
 
     def import_notes(self, filename):
+        """Import the notes in the ELF file FILENAME, returning an
+        index of them.  See i8c.runtime.noteindex for details."""
+        ef = self.__open_elffile(filename)
+        index, filename = {}, os.path.abspath(filename)
+        for note in ef.infinity_notes:
+            function = self.import_note(note)
+            noteindex.add(index, function.signature, filename, note.start)
+        return index
+
+    def import_many(self, filenames, jobs=None):
+        """Import the notes in every ELF file in FILENAMES, decoding
+        them in a pool of up to JOBS processes, one per CPU if JOBS
+        is None.  Returns an index of the imported notes.  Functions
+        are rebuilt from the decoded notes and verified in this
+        process, so unless lazy_notes is set much of the work of
+        importing them is not done in parallel."""
+        filenames = list(filenames)
+        if jobs is None:
+            jobs = multiprocessing.cpu_count()
+        jobs = min(jobs, len(filenames))
+        index = {}
+        if jobs < 2:
+            for filename in filenames:
+                noteindex.merge(index, self.import_notes(filename))
+            return index
+
+        if self.note_cache is not None:
+            cache_dir = self.note_cache.directory
+        else:
+            cache_dir = None
+        pool = multiprocessing.Pool(jobs)
+        try:
+            results = pool.map(decode_notes, [(filename, cache_dir)
+                                              for filename in filenames])
+        finally:
+            pool.close()
+            pool.join()
+
+        for filename, decoded_notes in zip(filenames, results):
+            if decoded_notes is None:
+                # Import it here to raise the worker's exception.
+                noteindex.merge(index, self.import_notes(filename))
+                continue
+            ef = self.__open_elffile(filename)
+            filename = os.path.abspath(filename)
+            for start, limit, decoded in decoded_notes:
+                function = functions.BytecodeFunction(
+                    ef[start:limit], decoded, self.lazy_notes)
+                self.register_function(function)
+                noteindex.add(index, function.signature, filename, start)
+        return index
+
+    def __load_indexed(self, signature):
+        """Import the notes which note_index says define functions
+        with signature SIGNATURE, returning True if any were
+        imported.  The index is built by scanning search_path if
+        none was supplied, and relative filenames in the index are
+        found by searching search_path."""
+        if self.note_index is None:
+            if not self.search_path:
+                return False
+            self.note_index = noteindex.scan(self.search_path)
+        result = False
+        for filename, offset in self.note_index.get(signature, ()):
+            note = self.__indexed_notes(filename).pop(offset, None)
+            if note is None:
+                continue # Already imported, or not a note.
+            # The index may be out of date.
+            if self.import_note(note).signature == signature:
+                result = True
+        return result
+
+    def __indexed_notes(self, filename):
+        """Return a dictionary mapping the offsets of the notes in
+        the indexed file FILENAME to the notes not yet imported."""
+        notes = self.__indexed_files.get(filename, None)
+        if notes is None:
+            if os.path.isabs(filename):
+                candidates = [filename]
+            else:
+                candidates = [os.path.join(dir, filename)
+                              for dir in self.search_path
+                              if os.path.isdir(dir)]
+            notes = {}
+            for candidate in candidates:
+                if os.path.isfile(candidate):
+                    ef = self.__open_elffile(candidate)
+                    notes = dict((note.start, note)
+                                 for note in ef.infinity_notes)
+                    break
+            self.__indexed_files[filename] = notes
+        return notes
+
+    def __open_elffile(self, filename):
         ef = elffile.open(filename)
         if self.wordsize is None:
             self.wordsize = ef.wordsize
@@ -84,42 +255,241 @@ class Context(object):
             self.byteorder = ef.byteorder
         else:
             assert ef.byteorder == self.byteorder
-        for note in ef.infinity_notes:
-            self.import_note(note)
+        return ef
 
     def import_note(self, note):
-        self.register_function(functions.BytecodeFunction(note))
+        if self.note_cache is not None:
+            function = self.note_cache.load(note, self.lazy_notes)
+        else:
+            function = functions.BytecodeFunction(note,
+                                                  lazy=self.lazy_notes)
+        self.register_function(function)
+        return function
 
     def new_stack(self):
         return stack.Stack(self.wordsize)
 
-    def call(self, signature, *args):
+    def acquire_stack(self):
+        """Return an empty stack, reusing a released one if possible."""
+        try:
+            return self.__stack_pool.pop()
+        except IndexError:
+            return self.new_stack()
+
+    def release_stack(self, stack):
+        """Return STACK to the pool for reuse by acquire_stack."""
+        del stack.slots[:]
+        self.__stack_pool.append(stack)
+
+    def pycode_for(self, function):
+        """Return FUNCTION translated into Python, or None if the
+        interpreter should be used.  Translated functions call each
+        other using Python's stack, so the interpreter is also used
+        once translated_depth_limit translated functions are
+        executing."""
+        if (not self.translate_notes or self.__hooks
+              or self.limits is not None
+              or self.translated_depth >= self.translated_depth_limit):
+            return None
+        return getattr(function, "pycode", None)
+
+    def call(self, signature, *args, **kwargs):
+        """Call the function with signature SIGNATURE, returning a
+        list of its results.  Keyword arguments "budget" and
+        "deadline" limit the number of operations executed and the
+        time.time by which execution must complete; they default
+        to call_budget and call_timeout seconds from now."""
+        if self.read_cache is not None and self.read_cache.per_call:
+            self.read_cache.invalidate()
+        function, stack, call_limits = self.new_call(signature, args, kwargs)
+        saved_limits = self.limits
+        if call_limits is not None:
+            self.limits = call_limits
+        try:
+            self.invoke(function, stack)
+        finally:
+            self.limits = saved_limits
+        return stack.pop_multi(function.rtypes)
+
+    def new_call(self, signature, args, kwargs):
+        """Start a call as described by call's arguments, returning
+        the function to call, a stack holding its arguments, and the
+        Limits the call should be executed with, or None."""
+        self.__check_call_keywords(kwargs)
+        budget = kwargs.pop("budget", self.call_budget)
+        deadline = kwargs.pop("deadline", None)
+        if deadline is None and self.call_timeout is not None:
+            deadline = time.time() + self.call_timeout
+
         function = self.get_function(signature)
         stack = self.new_stack()
         stack.push_multi(reversed(function.ptypes), reversed(args))
-        function.execute(self, stack)
-        return stack.pop_multi(function.rtypes)
+        for hook in self.call_hooks:
+            hook(self, function, stack)
+        if budget is None and deadline is None:
+            return function, stack, None
+        return function, stack, limits.Limits(budget, deadline)
+
+    @staticmethod
+    def __check_call_keywords(kwargs):
+        """Raise TypeError if KWARGS has keywords call does not
+        accept."""
+        unexpected = sorted(set(kwargs.keys()) - set(CALL_KEYWORDS))
+        if unexpected:
+            raise TypeError("unexpected keyword argument ‘%s’"
+                            % unexpected[0])
+
+    def call_many(self, signature, argument_rows, **kwargs):
+        """Call the same function for every argument tuple in
+        ARGUMENT_ROWS, returning a list of result lists.  Keyword
+        arguments are as for call, and apply to each call."""
+        self.__check_call_keywords(kwargs)
+        function = self.get_function(signature)
+        rows = [tuple(args) for args in argument_rows]
+        # Lane-parallel evaluation neither runs hooks nor counts
+        # operations, so only use it when nothing needs either.
+        if (not self.__hooks and self.limits is None
+              and kwargs.get("budget", self.call_budget) is None
+              and kwargs.get("deadline") is None
+              and self.call_timeout is None):
+            results = vector.call_many(function, rows)
+            if results is not None:
+                return results
+        return [self.call(function.signature, *args, **dict(kwargs))
+                for args in rows]
+
+    def read_memory(self, fmt, address):
+        """Return the bytes of the value with struct format FMT at
+        ADDRESS, using the read cache if there is one."""
+        if self.read_cache is None:
+            return self.env.read_memory(fmt, address)
+        return self.read_cache.read_memory(self.env, fmt, address)
+
+    def invoke(self, function, stack):
+        """Execute FUNCTION, using the call cache if possible."""
+        if self.uses_call_cache(function):
+            self.call_cache.execute(self, function, stack)
+        else:
+            function.execute(self, stack)
+
+    def enter_call(self, op):
+        """Record that the call operation OP is calling a function,
+        raising ExecutionLimitError if this would exceed the call
+        depth limit.  The caller must decrement call_depth when the
+        called function returns."""
+        if self.call_depth >= self.call_depth_limit:
+            raise ExecutionLimitError(
+                op, "call depth limit (%d) exceeded" % self.call_depth_limit)
+        self.call_depth += 1
+
+    def interprets(self, function):
+        """Return True if calls to FUNCTION from bytecode should be
+        made by the interpreter entering FUNCTION itself, or False
+        if they should be made using invoke."""
+        return (isinstance(function, functions.BytecodeFunction)
+                and self.pycode_for(function) is None)
+
+    def uses_call_cache(self, function):
+        """Return True if the results of calls to FUNCTION should be
+        looked up in and added to the call cache."""
+        return (self.call_cache is not None and not self.__hooks
+                and self.is_pure(function))
+
+    def is_pure(self, function):
+        """Return True if FUNCTION's results depend only on its
+        arguments."""
+        result = self.__purity.get(function, None)
+        if result is None:
+            result = self.__purity[function] = self.__check_purity(function)
+        return result
 
-    def __trace(self, location, stack, encoded, decoded):
-        function, pc = location
-        if self.tracelevel > 0:
-            if function != self.__last_traced:
-                fprint(sys.stdout, "\n%s:" % function)
-                self.__last_traced = function
-            if self.tracelevel > 1:
-                stack.trace(self.tracelevel)
-            fprint(sys.stdout, "  %04x: %-12s %s" % (pc, encoded, decoded))
-
-    def trace_operation(self, *args):
-        self.__trace(*args)
-
-    def trace_call(self, function, stack):
-        if not isinstance(function, functions.BytecodeFunction):
-            if self.tracelevel > 0:
-                fprint(sys.stdout, "\n%s:" % function)
-                fprint(sys.stdout, "  NON-BYTECODE FUNCTION")
-        self.__last_traced = None
-
-    def trace_return(self, location, stack):
-        self.__trace(location, stack, "", "RETURN")
-        self.__last_traced = None
+    def __check_purity(self, function):
+        seen, pending = set(), [function]
+        while pending:
+            function = pending.pop()
+            if function in seen:
+                continue
+            seen.add(function)
+            if not getattr(function, "is_locally_pure", False):
+                return False
+            for index in function.references:
+                if index == 0:
+                    continue
+                try:
+                    pending.append(
+                        self.get_function(function.externals[index - 1]))
+                except FunctionLookupError:
+                    return False
+        return True
+
+    # Methods to manage execution hooks
+
+    def add_hook(self, hook):
+        """Register HOOK to be notified of execution events.
+        See i8c.runtime.hooks for details."""
+        self.__hooks.append(hook)
+        self.__update_hooks()
+
+    def remove_hook(self, hook):
+        self.__hooks.remove(hook)
+        self.__update_hooks()
+
+    def __update_hooks(self):
+        for event in ("operation", "call", "return"):
+            methods = [getattr(hook, "on_" + event, None)
+                       for hook in self.__hooks]
+            setattr(self, event + "_hooks",
+                    tuple(method for method in methods
+                          if method is not None))
+
+    @property
+    def tracelevel(self):
+        if self.__tracer is None:
+            return 0
+        return self.__tracer.tracelevel
+
+    @tracelevel.setter
+    def tracelevel(self, value):
+        if self.__tracer is not None:
+            self.remove_hook(self.__tracer)
+            self.__tracer = None
+        if value > 0:
+            self.__tracer = hooks.TraceHook(value)
+            self.add_hook(self.__tracer)
+
+    def start_profiling(self):
+        """Start recording an execution profile, returning the
+        profiler.Profiler recording it."""
+        if self.__profiler is None:
+            self.__profiler = profiler.Profiler()
+            self.add_hook(self.__profiler)
+        return self.__profiler
+
+    def stop_profiling(self):
+        """Stop recording an execution profile, returning the
+        profiler.Profiler that recorded it, or None if no profile
+        was being recorded."""
+        result = self.__profiler
+        if result is not None:
+            self.remove_hook(result)
+            self.__profiler = None
+        return result
+
+def decode_notes(task):
+    """Decode the notes in one ELF file.  This is the worker function
+    for Context.import_many, and is called with a tuple of the file's
+    name and the note cache directory or None.  Returns a list of the
+    start and limit of each note and its decoded form, or None if
+    the file could not be imported."""
+    filename, cache_dir = task
+    try:
+        ef = elffile.open(filename)
+        if cache_dir is not None:
+            cache = notecache.NoteCache(cache_dir)
+            decode = cache.load
+        else:
+            decode = functions.BytecodeFunction
+        return [(note.start, note.limit, decode(note).decoded)
+                for note in ef.infinity_notes]
+    except I8XError:
+        return None
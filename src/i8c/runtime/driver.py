@@ -25,11 +25,16 @@ from __future__ import unicode_literals
 
 from .. import cmdline
 from .. import version
-from ..compat import fprint, load_module_from_source, strtoint_c
+from ..compat import StringIO
+from ..compat import fprint, fwrite, load_module_from_source, strtoint_c
 from . import context
-from . import I8XError
+from . import hooks
+from . import notecache
+from . import noteindex
+from . import FunctionLookupError, I8XError
 from . import TestCase
 import getopt
+import multiprocessing
 import os
 import sys
 try:
@@ -46,12 +51,27 @@ Infinity Note Execution Environment.
 Options:
   --help                Display this information.
   --version             Display version information.
+  --budget=N            Fail any call which executes more than N
+                        operations.
   -I DIR                Add the directory DIR to the list of directories
                         that TestCase.import_constants_from will search
                         for header files.
   -i, --import=ELFFILE  Import notes from ELFFILE.
+  -j, --jobs=N          Import ELF files and run test files using up to
+                        N processes in parallel.
+  -L, --library-path=PATH
+                        Import notes defining functions which are not
+                        otherwise defined from the ELF file PATH, or
+                        from the ELF files in the directory PATH.
+  --note-cache=DIR      Cache decoded notes in the directory DIR.
+  --note-index=FILE     Use the index of notes in FILE to locate notes
+                        in the library path.
+  --profile             Output an execution profile.
+  --profile-json=FILE   Output an execution profile, and write it to
+                        FILE in JSON format.
   -q, --quick           Execute the function and arguments specified on
                         command line.
+  --timeout=SECONDS     Fail any call which takes longer than SECONDS.
   -t, --trace           Trace function execution.  This option may be
                         specified multiple times for greater detail.""" \
     + cmdline.usage_message_footer_for("I8X")
@@ -85,17 +105,213 @@ class TestSuite(unittest.TestSuite):
                 and issubclass(item, TestCase)):
                 self.addTest(self.__loader.loadTestsFromTestCase(item))
 
+def hitcounts(ctx, coverage):
+    """Return a dictionary of the number of times each operation
+    in CTX has been executed according to the CoverageHook COVERAGE,
+    omitting operations not executed."""
+    result = {}
+    for sig, funclist in ctx.functions.items():
+        for index, function in enumerate(funclist):
+            if not hasattr(function, "ops"):
+                continue
+            for pc, op in function.ops.items():
+                count = coverage.hitcounts.get(op, 0)
+                if count:
+                    result[(sig, index, pc)] = count
+    return result
+
+def add_hitcounts(ctx, coverage, counts):
+    """Add hit counts returned by hitcounts to the CoverageHook
+    COVERAGE of CTX.  Functions another context loaded from its
+    search path are loaded into CTX the same way, and counts for
+    functions CTX cannot load are ignored."""
+    for (sig, index, pc), count in counts.items():
+        if sig not in ctx.functions:
+            try:
+                ctx.get_function(sig)
+            except FunctionLookupError:
+                pass
+        funclist = ctx.functions.get(sig, ())
+        if index >= len(funclist):
+            continue
+        op = funclist[index].ops[pc]
+        coverage.hitcounts[op] = coverage.hitcounts.get(op, 0) + count
+
+class RecordedTest(object):
+    """A testcase run by another process, described as unittest
+    would describe it."""
+
+    def __init__(self, test):
+        self.__str = str(test)
+        self.__description = test.shortDescription()
+
+    def __str__(self):
+        return self.__str
+
+    def shortDescription(self):
+        return self.__description
+
+def record_result(result):
+    """Return the outcome of the testcases in the TestResult RESULT
+    in a form that may be returned from a worker process."""
+    return {"testsRun": result.testsRun,
+            "failures": [(RecordedTest(test), err)
+                         for test, err in result.failures],
+            "errors": [(RecordedTest(test), err)
+                       for test, err in result.errors],
+            "skipped": [(RecordedTest(test), reason)
+                        for test, reason in result.skipped],
+            "expectedFailures": [(RecordedTest(test), err)
+                                 for test, err
+                                 in result.expectedFailures],
+            "unexpectedSuccesses": [RecordedTest(test)
+                                    for test
+                                    in result.unexpectedSuccesses]}
+
+class RecordedResults(object):
+    """The outcomes returned by record_result for several worker
+    processes, with the output and any error message of each.  Running this with
+    a TextTestRunner outputs each worker's output and then one
+    summary of every testcase, as if they had all been run by that
+    runner."""
+
+    def __init__(self, results):
+        self.results = results
+
+    def __call__(self, result):
+        for output, outcome, error in self.results:
+            fprint(sys.stdout, output.rstrip("\n"))
+            if error is not None:
+                fprint(sys.stderr, error)
+                continue
+            result.testsRun += outcome["testsRun"]
+            for name in ("failures", "errors", "skipped",
+                         "expectedFailures", "unexpectedSuccesses"):
+                getattr(result, name).extend(outcome[name])
+
+def run_testfile(task):
+    """Run the testcases in one file in a fresh context.  This is the
+    worker function for parallel test runs, and is called with a
+    dictionary of settings from the parent process and the file to
+    run.  Notes are loaded on demand using the parent's index, so
+    each worker only decodes the notes its testcases use.  Returns
+    a tuple of the captured output, the outcome of the testcases,
+    the hit counts of the context's operations, the profile or None,
+    and an error message or None.  The outcome of the testcases is
+    returned as described by record_result, with no summary in the
+    captured output."""
+    settings, filename = task
+    output = StringIO()
+    saved_stdout, sys.stdout = sys.stdout, output
+    try:
+        TestCase.include_path[:] = settings["include_path"]
+        ctx = context.Context()
+        if settings["note_cache"] is not None:
+            ctx.note_cache = notecache.NoteCache(settings["note_cache"])
+        ctx.wordsize = settings["wordsize"]
+        ctx.byteorder = settings["byteorder"]
+        ctx.search_path = settings["search_path"]
+        ctx.note_index = settings["note_index"]
+        ctx.tracelevel = settings["tracelevel"]
+        ctx.call_budget = settings["call_budget"]
+        ctx.call_timeout = settings["call_timeout"]
+        if settings["profile"]:
+            ctx.start_profiling()
+        TestCase.i8ctx = ctx
+        coverage = hooks.CoverageHook()
+        ctx.add_hook(coverage)
+
+        tests = TestSuite()
+        tests.load_i8tests(ctx, filename)
+        result = unittest.TextTestRunner(stream=output,
+                                         verbosity=2)._makeResult()
+        result.startTestRun()
+        try:
+            tests(result)
+        finally:
+            result.stopTestRun()
+    except I8XError as e:
+        return output.getvalue(), None, {}, None, str(e)
+    finally:
+        sys.stdout = saved_stdout
+    profile = ctx.stop_profiling()
+    if profile is not None:
+        profile = profile.as_dict()
+    return (output.getvalue(), record_result(result),
+            hitcounts(ctx, coverage), profile, None)
+
+def run_parallel(ctx, coverage, jobs, imported, filenames, profile):
+    """Run the testcases in FILENAMES using a pool of JOBS worker
+    processes, merging the coverage of each into the CoverageHook
+    COVERAGE of CTX and their profiles into PROFILE if it is not
+    None.  IMPORTED is the index of the notes CTX imported.  Returns
+    True if all testcases passed."""
+    # Imported notes take precedence over those in the search path,
+    # as they do in CTX.
+    index = {}
+    if ctx.search_path:
+        if ctx.note_index is None:
+            ctx.note_index = noteindex.scan(ctx.search_path)
+        index.update(ctx.note_index)
+    index.update(imported)
+    settings = {"include_path": list(TestCase.include_path),
+                "note_cache": None,
+                "wordsize": ctx.wordsize,
+                "byteorder": ctx.byteorder,
+                "search_path": list(ctx.search_path),
+                "note_index": index,
+                "tracelevel": ctx.tracelevel,
+                "call_budget": ctx.call_budget,
+                "call_timeout": ctx.call_timeout,
+                "profile": profile is not None}
+    if ctx.note_cache is not None:
+        settings["note_cache"] = ctx.note_cache.directory
+    tasks = [(settings, filename) for filename in filenames]
+    pool = multiprocessing.Pool(min(jobs, len(tasks)))
+    try:
+        results = pool.map(run_testfile, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    recorded = []
+    for output, outcome, counts, worker_profile, error in results:
+        recorded.append((output, outcome, error))
+        add_hitcounts(ctx, coverage, counts)
+        if worker_profile is not None:
+            profile.merge(worker_profile)
+    result = unittest.TextTestRunner(stream=sys.stdout, verbosity=2).run(
+        RecordedResults(recorded))
+    failed = any(error is not None for output, outcome, error in recorded)
+    return result.wasSuccessful() and not failed
+
+def report_profile(profile, jsonfile):
+    """Output PROFILE as a table, and as JSON if JSONFILE is not
+    None."""
+    print()
+    print("Profile:")
+    print()
+    fprint(sys.stdout, profile.format_table())
+    if jsonfile is not None:
+        with open(jsonfile, "w") as fp:
+            fwrite(fp, profile.as_json() + "\n")
+
 def main(args):
     clue = "Try ‘i8x --help’ for more information."
     try:
         opts, args = getopt.gnu_getopt(
             args,
-            "i:I:qt",
-            ("help", "version", "import=", "quick", "trace"))
+            "i:I:j:L:qt",
+            ("help", "version", "budget=", "import=", "jobs=",
+             "library-path=", "note-cache=", "note-index=", "profile",
+             "profile-json=", "quick", "timeout=", "trace"))
     except getopt.GetoptError as e:
         raise I8XError("%s\n%s" % (e, clue))
     ctx = context.Context()
+    imports = []
+    jobs = 1
     quickmode = False
+    profile = profile_json = None
     for opt, arg in opts:
         if opt == "--help":
             fprint(sys.stdout, USAGE)
@@ -103,15 +319,46 @@ def main(args):
         elif opt == "--version":
             fprint(sys.stdout, cmdline.version_message_for("I8X", LICENSE))
             return
+        elif opt == "--budget":
+            ctx.call_budget = strtoint_c(arg, I8XError)
+            if ctx.call_budget < 0:
+                raise I8XError("invalid budget ‘%s’" % arg)
         elif opt == "-I":
             TestCase.include_path.append(arg)
         elif opt in ("-i", "--import"):
-            ctx.import_notes(arg)
+            imports.append(arg)
+        elif opt in ("-j", "--jobs"):
+            jobs = strtoint_c(arg, I8XError)
+            if jobs < 1:
+                raise I8XError("invalid number of jobs ‘%s’" % arg)
+        elif opt in ("-L", "--library-path"):
+            ctx.search_path.append(arg)
+        elif opt == "--note-cache":
+            ctx.note_cache = notecache.NoteCache(arg)
+        elif opt == "--note-index":
+            ctx.note_index = noteindex.load(arg)
+        elif opt == "--profile":
+            profile = ctx.start_profiling()
+        elif opt == "--profile-json":
+            profile = ctx.start_profiling()
+            profile_json = arg
         elif opt in ("-q", "--quick"):
             quickmode = True
+        elif opt == "--timeout":
+            try:
+                ctx.call_timeout = float(arg)
+            except ValueError:
+                ctx.call_timeout = -1
+            if not ctx.call_timeout > 0:
+                raise I8XError("invalid timeout ‘%s’" % arg)
         elif opt in ("-t", "--trace"):
             ctx.tracelevel += 1
 
+    # Quick mode executes only a few functions, so only decode
+    # those that are actually used.
+    ctx.lazy_notes = quickmode
+    imported = ctx.import_many(imports, jobs)
+
     if len(args) < 1:
         raise I8XError("nothing to do!\n%s" % clue)
 
@@ -120,6 +367,8 @@ def main(args):
         args = [strtoint_c(arg, I8XError) for arg in args]
         result = map(str, ctx.call(function, *args))
         fprint(sys.stdout, ", ".join(result))
+        if profile is not None:
+            report_profile(profile, profile_json)
         return
 
     if not hasattr(TestCase, "assertIsInstance"):
@@ -133,30 +382,38 @@ def main(args):
     print("I8X", version(), "on Python", sys.version)
     print()
 
-    TestCase.i8ctx = ctx
+    coverage = hooks.CoverageHook()
+    if jobs > 1 and len(args) > 1:
+        success = run_parallel(ctx, coverage, jobs, imported, args,
+                               profile)
+    else:
+        TestCase.i8ctx = ctx
+        ctx.add_hook(coverage)
 
-    tests = TestSuite()
-    for filename in args:
-        tests.load_i8tests(ctx, filename)
+        tests = TestSuite()
+        for filename in args:
+            tests.load_i8tests(ctx, filename)
 
-    result = unittest.TextTestRunner(stream=sys.stdout,
-                                     verbosity=2).run(tests)
-    if not result.wasSuccessful():
+        result = unittest.TextTestRunner(stream=sys.stdout,
+                                         verbosity=2).run(tests)
+        success = result.wasSuccessful()
+    if profile is not None:
+        report_profile(profile, profile_json)
+    if not success:
         return 1
 
     report = []
     ops_hit = opcount = maxlen = 0
     for sig, funclist in sorted(ctx.functions.items()):
         for function in funclist:
-            hit, count = function.coverage
+            hit, count = coverage.coverage(function)
             ops_hit += hit
             opcount += count
             maxlen = max(len(sig), maxlen)
             report.append((sig, hit, count))
 
     if ops_hit != opcount:
-        if hasattr(result, "separator2"):
-            print(result.separator2)
+        print(unittest.TextTestResult.separator2)
         print("Coverage:")
         print()
 
@@ -23,13 +23,32 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from ..compat import integer
+from ..compat import integer, memory_view
 from .. import constants
 from . import ELFFileError
+import mmap
 import struct
-import subprocess
 import sys
 
+class Section(object):
+    """A section header."""
+
+    def __init__(self, fields):
+        (self.name_offset, self.type, self.flags, self.addr,
+         self.offset, self.size, self.link, self.info,
+         self.addralign, self.entsize) = fields
+        self.name = None
+
+    def __str__(self):
+        return self.name
+
+class Segment(object):
+    """A program header."""
+
+    def __init__(self, fields):
+        (self.type, self.offset, self.vaddr, self.paddr,
+         self.filesz, self.memsz, self.flags, self.align) = fields
+
 class ELFFile(object):
     ELFCLASS32 = 1
     ELFCLASS64 = 2
@@ -39,16 +58,45 @@ class ELFFile(object):
     ELFDATA2MSB = 2
     BYTEORDERS = {ELFDATA2LSB: b"<", ELFDATA2MSB: b">"}
 
+    # Header layouts, excluding e_ident.  "W" is replaced with the
+    # format character for a word of the file's class.
+    EHDR_FORMAT = b"HHIWWWIHHHHHH"
+    SHDR_FORMAT = b"IIWWWWIIWW"
+    PHDR_FORMATS = {32: b"IIIIIIII", 64: b"IIQQQQQQ"}
+    SYM_FORMATS = {32: b"IIIBBH", 64: b"IBBHQQ"}
+
+    EI_NIDENT = 16
+    ET_REL = 1
+    SHN_UNDEF = 0
+    SHN_XINDEX = 0xffff
+    SHT_SYMTAB = 2
+    SHT_RELA = 4
+    SHT_NOTE = 7
+    SHT_NOBITS = 8
+    SHT_REL = 9
+    SHT_DYNSYM = 11
+    STT_SECTION = 3
+    PT_LOAD = 1
+    PT_NOTE = 4
+    INFINITY_SECTION = ".note.infinity"
+    PROPERTY_SECTION = ".note.gnu.property"
+
     __open = open
 
     def __init__(self, filename):
         self.filename = filename
         with self.__open(self.filename, "rb") as fp:
-            self.bytes = fp.read()
+            try:
+                self.bytes = mmap.mmap(fp.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped.
+                self.bytes = b""
         self.start, self.limit = 0, len(self.bytes)
         hdrfmt = b"4sBB"
-        hdrlen = struct.calcsize(hdrfmt)
-        magic, ei_class, ei_data = struct.unpack(hdrfmt, self.bytes[:hdrlen])
+        if self.limit < self.EI_NIDENT:
+            raise ELFFileError(filename, "not an ELF file")
+        magic, ei_class, ei_data = struct.unpack_from(hdrfmt, self.bytes)
         if magic != b"\x7fELF":
             raise ELFFileError(filename, "not an ELF file")
         try:
@@ -56,89 +104,231 @@ class ELFFile(object):
             self.byteorder = self.BYTEORDERS[ei_data]
         except KeyError:
             raise ELFFileError(filename, "unhandled ELF file")
-        self.sections = self.relocations = self.symbols = None
+        try:
+            self.__read_headers()
+        except struct.error:
+            raise ELFFileError(filename, "truncated ELF file")
+        self.relocations = self.symbols = None
+        self.__symbol_tables = {}
+
+    # Methods to read the ELF, section and program headers
+
+    def __format(self, format):
+        word, sword = {32: (b"I", b"i"), 64: (b"Q", b"q")}[self.wordsize]
+        format = format.replace(b"W", word).replace(b"S", sword)
+        return self.byteorder + format
+
+    def __unpack_table(self, format, offset, entsize, count):
+        format = self.__format(format)
+        if count and entsize < struct.calcsize(format):
+            raise ELFFileError(self.filename, "corrupt ELF file")
+        return [struct.unpack_from(format, self.bytes,
+                                   offset + index * entsize)
+                for index in range(count)]
+
+    def __read_headers(self):
+        (e_type, e_machine, e_version, e_entry, e_phoff, e_shoff,
+         e_flags, e_ehsize, e_phentsize, e_phnum, e_shentsize,
+         e_shnum, e_shstrndx) = struct.unpack_from(
+             self.__format(self.EHDR_FORMAT), self.bytes, self.EI_NIDENT)
+        self.type = e_type
+
+        self.sections = []
+        if e_shoff != 0:
+            if e_shnum == 0 or e_shstrndx == self.SHN_XINDEX:
+                # Extended numbering: the real values are stored
+                # in the initial section header.
+                first = Section(self.__unpack_table(
+                    self.SHDR_FORMAT, e_shoff, e_shentsize, 1)[0])
+                if e_shnum == 0:
+                    e_shnum = first.size
+                if e_shstrndx == self.SHN_XINDEX:
+                    e_shstrndx = first.link
+            self.sections = [Section(fields)
+                             for fields in self.__unpack_table(
+                                     self.SHDR_FORMAT, e_shoff,
+                                     e_shentsize, e_shnum)]
+        if self.SHN_UNDEF < e_shstrndx < len(self.sections):
+            strtab = self.sections[e_shstrndx]
+            for section in self.sections:
+                section.name = self.__read_string(strtab,
+                                                  section.name_offset)
+
+        self.segments = []
+        for fields in self.__unpack_table(self.PHDR_FORMATS[self.wordsize],
+                                          e_phoff, e_phentsize, e_phnum):
+            if self.wordsize == 64:
+                # p_flags moved to keep the words aligned.
+                fields = fields[:1] + fields[2:7] + fields[1:2] + fields[7:]
+            self.segments.append(Segment(fields))
+
+    def __read_string(self, strtab, offset):
+        start = strtab.offset + offset
+        limit = self.bytes.find(b"\0", start, strtab.offset + strtab.size)
+        if limit < 0:
+            raise ELFFileError(self.filename, "corrupt string table")
+        return self.bytes[start:limit].decode("utf-8")
+
+    # Methods to locate notes
+
+    @property
+    def note_areas(self):
+        """Yield (offset, size, alignment) for each area of the file
+        which may contain Infinity notes.  If the file has section
+        headers then only .note.infinity sections are used, because
+        other GNU notes may have the same type.  Files with no such
+        section fall back to every note section except the GNU
+        property section, and files with no note sections to all
+        note segments."""
+        sections = [section for section in self.sections
+                    if section.type == self.SHT_NOTE]
+        infinity = [section for section in sections
+                    if section.name == self.INFINITY_SECTION]
+        if not infinity:
+            infinity = [section for section in sections
+                        if section.name != self.PROPERTY_SECTION]
+        if infinity:
+            for section in infinity:
+                yield section.offset, section.size, section.addralign
+        elif not sections:
+            for segment in self.segments:
+                if segment.type == self.PT_NOTE:
+                    yield segment.offset, segment.filesz, segment.align
+
+    @property
+    def notes(self):
+        """Yield (type, name, descstart, desclimit) for each note."""
+        hdrfmt = self.byteorder + b"3I"
+        hdrsz = struct.calcsize(hdrfmt)
+        for start, size, align in self.note_areas:
+            align = 8 if align == 8 else 4
+            roundup = lambda offset: (offset + align - 1) & ~(align - 1)
+            limit = start + size
+            if limit > self.limit:
+                raise ELFFileError(self.filename, "truncated note area")
+            while start + hdrsz <= limit:
+                namesz, descsz, type = struct.unpack_from(
+                    hdrfmt, self.bytes, start)
+                namestart = start + hdrsz
+                descstart = roundup(namestart + namesz)
+                desclimit = descstart + descsz
+                if desclimit > limit:
+                    raise ELFFileError(self.filename, "corrupt note")
+                yield (type, self.bytes[namestart:namestart + namesz],
+                       descstart, desclimit)
+                start = roundup(desclimit)
 
     @property
     def infinity_notes(self):
-        # XXX this is not a real ELF parser!
-        notename = b"GNU\0"
-        markerfmt = self.byteorder + ("I%ds" % len(notename)).encode("utf-8")
-        marker = struct.pack(markerfmt, constants.NT_GNU_INFINITY, notename)
-        hdrfmt = self.byteorder + b"2I"
-        start = hdrsz = struct.calcsize(hdrfmt)
-        while True:
-            start = self.bytes.find(marker, start)
-            if start < 0:
-                break
-            start -= hdrsz
-            namesz, descsz = struct.unpack(
-                hdrfmt, self.bytes[start:start + hdrsz])
-            if namesz != len(notename):
-                start += hdrsz + 1 # Spurious match
-                continue
-            descstart = start + hdrsz + struct.calcsize("I") + len(notename)
-            desclimit = descstart + descsz
-            yield self[descstart:desclimit]
-            start = desclimit
+        for type, name, descstart, desclimit in self.notes:
+            if type == constants.NT_GNU_INFINITY and name == b"GNU\0":
+                yield self[descstart:desclimit]
 
     def __getitem__(self, key):
         return ELFSlice(self, key)
 
-    def __objdump(self, what):
-        command = ["objdump", "--" + what, self.filename]
-        process = None
+    # Methods to read symbol and relocation tables
+
+    def __read_table(self, section, format):
+        if section.type == self.SHT_NOBITS or section.entsize == 0:
+            return []
+        return self.__unpack_table(format, section.offset,
+                                   section.entsize,
+                                   section.size // section.entsize)
+
+    def __symbol_table(self, section):
+        """Return a list of (name, value) for each symbol in SECTION.
+        Section symbols are named after their section."""
         try:
-            process = subprocess.Popen(command, stdout=subprocess.PIPE)
-            return [line.decode("utf-8")
-                    for line in process.stdout.readlines()]
-        finally:
-            if process is not None:
-                process.stdout.close()
-                process.wait()
-                if process.returncode != 0:
-                    sys.exit(process.returncode) # XXX
-
-    def __read_sections(self):
-        self.sections = {}
-        for line in self.__objdump("section-headers"):
-            fields = line.strip().split()
-            if len(fields) != 7 or fields[6][1:-1] != "**":
-                continue
-            name = fields[1]
-            assert not name in self.sections
-            self.sections[name] = int(fields[5], 16)
+            table = self.__symbol_tables[section]
+        except KeyError:
+            pass
+        else:
+            return table
+        if section.link >= len(self.sections):
+            raise ELFFileError(self.filename, "corrupt symbol table")
+        strtab = self.sections[section.link]
+        table = []
+        for fields in self.__read_table(section,
+                                        self.SYM_FORMATS[self.wordsize]):
+            if self.wordsize == 64:
+                name, info, other, shndx, value, size = fields
+            else:
+                name, value, size, info, other, shndx = fields
+            name = self.__read_string(strtab, name)
+            if (not name
+                  and info & 0xf == self.STT_SECTION
+                  and shndx < len(self.sections)):
+                name = self.sections[shndx].name
+            table.append((name, value))
+        self.__symbol_tables[section] = table
+        return table
+
+    def __file_offset(self, address):
+        for segment in self.segments:
+            if (segment.type == self.PT_LOAD
+                  and segment.vaddr <= address
+                  < segment.vaddr + segment.filesz):
+                return segment.offset + address - segment.vaddr
 
     def __read_relocations(self):
-        if self.sections is None:
-            self.__read_sections()
         self.relocations = {}
-        for line in self.__objdump("reloc"):
-            fields = line.strip().split()
-            if fields[:3] == ["RELOCATION", "RECORDS", "FOR"]:
-                sectionoffset = self.sections[fields[3][1:-2]]
+        for section in self.sections:
+            if section.type == self.SHT_RELA:
+                format = b"WWS"
+            elif section.type == self.SHT_REL:
+                format = b"WW"
+            else:
                 continue
-            if len(fields) != 3:
-                continue
-            try:
-                offset = sectionoffset + int(fields[0], 16)
-            except ValueError:
-                continue
-            assert offset not in self.relocations
-            self.relocations[offset] = fields[2]
+            if section.link >= len(self.sections):
+                raise ELFFileError(self.filename, "corrupt relocations")
+            symbols = self.__symbol_table(self.sections[section.link])
+            # Relocatable files' relocations are located by offset
+            # within the section they apply to, other files' by
+            # virtual address.
+            if (self.type == self.ET_REL
+                  and 0 < section.info < len(self.sections)):
+                target = self.sections[section.info].offset
+            else:
+                target = None
+            for fields in self.__read_table(section, format):
+                offset, info = fields[:2]
+                addend = fields[2] if len(fields) > 2 else 0
+                if target is not None:
+                    offset += target
+                else:
+                    offset = self.__file_offset(offset)
+                    if offset is None:
+                        continue
+                if self.wordsize == 64:
+                    symbol = info >> 32
+                else:
+                    symbol = info >> 8
+                if symbol == 0:
+                    name = "*ABS*"
+                elif symbol < len(symbols):
+                    name = symbols[symbol][0]
+                else:
+                    raise ELFFileError(self.filename, "corrupt relocations")
+                if addend:
+                    # Format addends as objdump does, zero-padded
+                    # to the word size.
+                    name += "%s0x%0*x" % ("-" if addend < 0 else "+",
+                                          self.wordsize // 4, abs(addend))
+                assert offset not in self.relocations
+                self.relocations[offset] = name
 
     def __read_symbols(self):
         self.symbols = {}
-        for line in self.__objdump("syms"):
-            fields = line.strip().split()
-            if len(fields) < 2:
-                continue
-            try:
-                address = int(fields[0], 16)
-            except ValueError:
+        for section in self.sections:
+            if section.type not in (self.SHT_SYMTAB, self.SHT_DYNSYM):
                 continue
-            if address not in self.symbols:
-                self.symbols[address] = []
-            self.symbols[address].append(fields[-1])
+            for name, address in self.__symbol_table(section)[1:]:
+                if not name:
+                    continue
+                names = self.symbols.setdefault(address, [])
+                if name not in names:
+                    names.append(name)
 
     def relocation_at(self, location):
         if self.relocations is None:
@@ -151,6 +341,10 @@ class ELFFile(object):
         return self.symbols[address]
 
 class ELFSlice(object):
+    """A range of bytes within an ELF file.  Slices reference the
+    file's mapping rather than copying it, and creating a subslice
+    or accessing a single byte takes constant time."""
+
     def __init__(self, elffile, ourslice):
         assert isinstance(ourslice, slice)
         assert ourslice.step in (None, 1)
@@ -177,10 +371,12 @@ class ELFSlice(object):
 
     def __getitem__(self, key):
         if isinstance(key, integer):
-            result = self.bytes[key]
-            if isinstance(result, int):
-                result = chr(result)
-            return result
+            if key < 0:
+                key += self.limit - self.start
+            index = self.start + key
+            if not self.start <= index < self.limit:
+                raise IndexError(key)
+            return self.elffile.bytes[index:index + 1].decode("iso-8859-1")
 
         assert isinstance(key, slice)
         assert key.step in (None, 1)
@@ -204,6 +400,28 @@ class ELFSlice(object):
         assert start <= self.limit
         return self.elffile[start:self.limit]
 
+    def find(self, sub):
+        """Return the offset of the first occurrence of SUB in this
+        slice, or -1 if SUB is not found."""
+        index = self.elffile.bytes.find(sub, self.start, self.limit)
+        if index >= 0:
+            index -= self.start
+        return index
+
+    def unpack(self, format, offset=0):
+        """Unpack values from this slice starting at OFFSET.  FORMAT
+        should not include a byte order character; the file's byte
+        order is used."""
+        format = self.byteorder + format
+        if offset + struct.calcsize(format) > len(self):
+            raise struct.error("unpack requires a longer slice")
+        return struct.unpack_from(format, self.elffile.bytes,
+                                  self.start + offset)
+
+    @property
+    def memory(self):
+        return memory_view(self.elffile.bytes, self.start, self.limit)
+
     @property
     def bytes(self):
         return self.elffile.bytes[self.start:self.limit]
@@ -212,14 +430,14 @@ class ELFSlice(object):
     def text(self):
         text = self.bytes
         if sys.version_info >= (3,):
-            text = "".join(map(chr, text))
+            text = text.decode("iso-8859-1")
         assert isinstance(text, str)
         return text
 
     @property
     def symbol_names(self):
-        format = self.byteorder + {32: b"I", 64: b"Q"}[self.wordsize]
-        address = struct.unpack(format, self.bytes)[0]
+        format = {32: b"I", 64: b"Q"}[self.wordsize]
+        address = self.unpack(format)[0]
         if address == 0:
             return [self.elffile.relocation_at(self.start)]
         else:
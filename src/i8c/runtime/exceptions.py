@@ -65,6 +65,14 @@ class CorruptNoteError(NoteError):
     def __init__(self, elfslice):
         NoteError.__init__(self, elfslice, "corrupt note")
 
+class StackOverflowError(CorruptNoteError):
+    """Execution exceeded the maximum stack depth a note declared.
+    """
+    def __init__(self, elfslice, max_stack):
+        NoteError.__init__(
+            self, elfslice,
+            "corrupt note: stack exceeds max_stack (%d)" % max_stack)
+
 class UnhandledNoteError(NoteError):
     """An unhandled note was detected.
     """
@@ -113,3 +121,8 @@ class BadDerefError(ExecutionError):
     def __init__(self, op, mem, loc):
         ExecutionError.__init__(
             self, op, "0x%08x: invalid location:\n%s" % (loc, mem))
+
+class ExecutionLimitError(ExecutionError):
+    """Execution exceeded its instruction budget, its deadline or
+    the maximum call depth.
+    """
@@ -29,8 +29,13 @@ from .. import constants
 from . import *
 from . import leb128
 from . import operations
+from . import translator
 from . import types
+from . import verifier
 import struct
+import threading
+
+DECODE_LOCK = threading.RLock()
 
 class Function(object):
     def __init__(self, src):
@@ -48,14 +53,11 @@ class Function(object):
         self.ptypes = ptypes
         self.rtypes = rtypes
         self.type = types.FunctionType(ptypes, rtypes)
+        self.signature = "%s::%s(%s)%s" % (provider, name,
+                                           types.encode(ptypes),
+                                           types.encode(rtypes))
         self.__sig_set = True
 
-    @property
-    def signature(self):
-        return "%s::%s(%s)%s" % (self.provider, self.name,
-                                 types.encode(self.ptypes),
-                                 types.encode(self.rtypes))
-
     def __str__(self):
         return self.signature
 
@@ -68,24 +70,87 @@ class BuiltinFunction(Function):
         self.impl = impl
 
     def execute(self, ctx, stack):
+        self.push_results(ctx, stack, self.impl(*self.pop_arguments(stack)))
+
+    def pop_arguments(self, stack):
+        """Pop this function's arguments from STACK, returning them
+        in the order the implementation expects."""
         args = stack.pop_multi(reversed(self.ptypes))
         args.reverse()
-        result = self.impl(*args)
+        return args
+
+    def push_results(self, ctx, stack, result):
+        """Push RESULT, as returned by the implementation, onto
+        STACK."""
         if len(self.rtypes) == 0:
             assert result is None
             result = []
         elif len(self.rtypes) == 1:
             result = [result]
         stack.push_multi(self.rtypes, result)
+        for hook in ctx.return_hooks:
+            hook(ctx, self, stack)
 
 class BytecodeFunction(Function):
-    def __init__(self, src):
+    # Attributes which are not set until the function's body is
+    # decoded.  "bytecode" remains unset for notes with no code.
+    BODY_ATTRIBUTES = ("bytecode", "ops", "externals",
+                       "is_locally_pure", "references", "verification")
+
+    # The maximum stack depth recorded in the note's code info, or
+    # None for notes with no code info chunk.
+    max_stack = None
+
+    def __init__(self, src, decoded=None, lazy=False):
+        """Decode the note SRC, or restore the previously decoded
+        form DECODED.  If LAZY is True only the signature and code
+        info are decoded here; the rest of the note is decoded the
+        first time it is required."""
         Function.__init__(self, src)
-        self.__split_chunks()
-        self.__unpack_signature()
-        self.__unpack_codeinfo()
-        self.__unpack_bytecode()
-        self.__unpack_externals()
+        self.__body_decoded = False
+        self.__decode_error = None
+        self.__decoded = decoded
+        if decoded is not None:
+            self.__restore_signature(decoded)
+        else:
+            self.__split_chunks()
+            self.__unpack_signature()
+            self.__unpack_codeinfo()
+        if not lazy:
+            self.__decode_body()
+
+    def __getattr__(self, name):
+        if name not in self.BODY_ATTRIBUTES:
+            raise AttributeError(name)
+        # Functions may be shared between threads, so only one may
+        # decode the body; the others wait for it to finish.
+        with DECODE_LOCK:
+            if self.__body_decoded:
+                if self.__decode_error is not None:
+                    raise self.__decode_error
+                return object.__getattribute__(self, name)
+            self.__decode_body()
+        return getattr(self, name)
+
+    def __decode_body(self):
+        assert not self.__body_decoded
+        self.__body_decoded = True
+        try:
+            if self.__decoded is not None:
+                self.__restore_body(self.__decoded)
+                self.__decoded = None
+            else:
+                self.__unpack_bytecode()
+                self.__unpack_externals()
+            self.__find_references()
+            self.verification = verifier.verify(self)
+        except Exception as e:
+            # Drop anything decoded before the failure so that every
+            # later access reaches __getattr__ and fails the same way.
+            for name in self.BODY_ATTRIBUTES:
+                self.__dict__.pop(name, None)
+            self.__decode_error = e
+            raise
 
     def __split_chunks(self):
         self.chunks, offset = {}, 0
@@ -120,7 +185,7 @@ class BytecodeFunction(Function):
     def get_string(self, start):
         chunk = self.one_chunk(constants.I8_CHUNK_STRINGS, 1, True)
         unterminated = chunk + start
-        limit = unterminated.bytes.find(b"\0")
+        limit = unterminated.find(b"\0")
         if limit < 0:
             raise CorruptNoteError(unterminated)
         return unterminated[:limit]
@@ -147,42 +212,99 @@ class BytecodeFunction(Function):
             return
 
         expect = archspec.encode(chunk.wordsize)
-        format = self.byteorder + b"H"
+        format = b"H"
         offset = struct.calcsize(format)
-        actual = struct.unpack(format, chunk[:offset].bytes)[0]
+        actual = chunk.unpack(format)[0]
         if actual != expect:
             raise UnhandledNoteError(chunk)
 
         offset, self.max_stack = leb128.read_uleb128(chunk, offset)
 
     def __unpack_bytecode(self):
-        self.ops = {}
-
         chunk = self.one_chunk(constants.I8_CHUNK_BYTECODE, 2, False)
         if chunk is None:
+            self.ops = {}
             return
 
         self.bytecode = chunk
-        pc, limit = 0, len(self.bytecode)
+        ops, pc, limit = {}, 0, len(self.bytecode)
         while pc < limit:
             op = operations.Operation(self, pc)
-            self.ops[pc] = op
+            ops[pc] = op
             pc += op.size
         if pc != limit:
             raise CorruptNoteError(self.bytecode + pc)
+        self.ops = ops
 
     def __unpack_externals(self):
-        self.externals = []
-
+        externals = []
         chunk = self.one_chunk(constants.I8_CHUNK_EXTERNALS, 2, False)
-        if chunk is None:
-            return
+        if chunk is not None:
+            unterminated = chunk
+            while len(unterminated):
+                extern = UnresolvedFunction(self, unterminated)
+                externals.append(extern)
+                unterminated += len(extern.src)
+        self.externals = externals
 
-        unterminated = chunk
-        while len(unterminated):
-            extern = UnresolvedFunction(self, unterminated)
-            self.externals.append(extern)
-            unterminated += len(extern.src)
+    # Methods to save and restore the decoded form
+
+    @property
+    def decoded(self):
+        """A tuple of builtin types from which this function may
+        be recreated without decoding its note again."""
+        if hasattr(self, "bytecode"):
+            bytecode = self.__offsets(self.bytecode)
+            ops = [(pc, op.size, op.opcode, tuple(op.operands))
+                   for pc, op in sorted(self.ops.items())]
+        else:
+            bytecode, ops = None, ()
+        externals = [(self.__offsets(ext.src), ext.provider, ext.name,
+                      types.encode(ext.ptypes), types.encode(ext.rtypes))
+                     for ext in self.externals]
+        return (self.provider, self.name,
+                types.encode(self.ptypes), types.encode(self.rtypes),
+                getattr(self, "max_stack", None),
+                bytecode, tuple(ops), tuple(externals))
+
+    def __offsets(self, part):
+        return part.start - self.src.start, part.limit - self.src.start
+
+    def __restore_signature(self, decoded):
+        (provider, name, ptypes, rtypes, max_stack,
+         bytecode, ops, externals) = decoded
+        self.set_signature(provider, name,
+                           types.decode(ptypes), types.decode(rtypes))
+        if max_stack is not None:
+            self.max_stack = max_stack
+
+    def __restore_body(self, decoded):
+        (provider, name, ptypes, rtypes, max_stack,
+         bytecode, ops, externals) = decoded
+        if bytecode is not None:
+            self.bytecode = self.src[slice(*bytecode)]
+        self.ops = dict((pc, operations.Operation.restore(
+                             self, pc, size, opcode, operands))
+                        for pc, size, opcode, operands in ops)
+        self.externals = [
+            UnresolvedFunction(self, self.src[slice(*offsets)],
+                               (provider, name, ptypes, rtypes))
+            for offsets, provider, name, ptypes, rtypes in externals]
+
+    def __find_references(self):
+        """Determine whether this function's results could depend on
+        anything other than its arguments and the functions it
+        references, and which externals it references."""
+        is_locally_pure = not any(
+            isinstance(type, types.FunctionType) for type in self.ptypes)
+        references = set()
+        for op in self.ops.values():
+            if not op.is_pure:
+                is_locally_pure = False
+            elif op.opcode == constants.I8_OP_load_external:
+                references.add(op.operand)
+        self.is_locally_pure = is_locally_pure
+        self.references = references
 
     @property
     def external_functions(self):
@@ -190,36 +312,154 @@ class BytecodeFunction(Function):
                 for ext in self.externals
                 if isinstance(ext, UnresolvedFunction)]
 
+    @property
+    def pycode(self):
+        """This function translated into Python, or None if it
+        could not be translated."""
+        try:
+            return self.__pycode
+        except AttributeError:
+            self.__pycode = translator.translate(self)
+            return self.__pycode
+
     def execute(self, ctx, caller_stack):
-        stack = ctx.new_stack()
+        pycode = ctx.pycode_for(self)
+        if pycode is not None:
+            args = [caller_stack.pop_raw() for type in self.ptypes]
+            args.reverse()
+            ctx.translated_depth += 1
+            try:
+                results = pycode(ctx, *args)
+            finally:
+                ctx.translated_depth -= 1
+            for value in results:
+                caller_stack.push_raw(value)
+            return
+
+        stack = ctx.acquire_stack()
         caller_stack.pop_multi_onto(reversed(self.ptypes), stack)
-        pc, return_pc = 0, len(self.bytecode)
-        while pc >= 0 and pc < return_pc:
-            op = self.ops.get(pc, None)
-            if op is None:
-                raise BadJumpError(stack.op)
-            stack.op = op
-            pc_adjust = op.execute(ctx, self.externals, stack)
-            pc += op.size
-            if pc_adjust is not None:
-                pc += pc_adjust
-            last_op = op
-        if pc != return_pc:
-            raise BadJumpError(stack.op)
-        ctx.trace_return((self.signature, pc), stack)
+        self.__interpret(ctx, stack)
         stack.pop_multi_onto(self.rtypes, caller_stack)
-
-    @property
-    def coverage(self):
-        ops_hit = opcount = 0
-        for op in self.ops.values():
-            if op.hitcount > 0:
-                ops_hit += 1
-            opcount += 1
-        return ops_hit, opcount
+        ctx.release_stack(stack)
+
+    def __interpret(self, ctx, stack):
+        """Interpret this function, and every bytecode function it
+        calls that the context does not execute some other way, in
+        a single loop.  Callers' frames are kept in a list rather
+        than on Python's stack.  A call which is its function's last
+        operation and returns as many values replaces the caller's
+        frame, unless return hooks are installed or the call's
+        results are to be cached."""
+        base_depth = ctx.call_depth
+        try:
+            self.__interpret_frames(ctx, stack)
+        finally:
+            ctx.call_depth = base_depth
+
+    def __interpret_frames(self, ctx, stack):
+        hooks, limits = ctx.operation_hooks, ctx.limits
+        checking = bool(hooks) or limits is not None
+        tail_calls = not ctx.return_hooks
+        cache = ctx.call_cache
+        frames = []
+        # RTYPES are the types the current frame must return, which
+        # after a tail call are those of the function it replaced.
+        function, pc, rtypes = self, 0, self.rtypes
+        op, count = None, 0
+        while True:
+            ops, externals = function.ops, function.externals
+            return_pc = len(function.bytecode)
+            # Verified functions cannot jump outside their code or
+            # overflow their stack, so only other functions' jumps
+            # and stack depth are checked.
+            checked = function.verification is None
+            max_stack = function.max_stack if checked else None
+            callee = None
+            if checking or checked:
+                while pc != return_pc:
+                    op = ops[pc]
+                    for hook in hooks:
+                        hook(ctx, op, stack)
+                    if limits is not None:
+                        count += 1
+                        if count == limits.BATCH:
+                            limits.consume(count, op)
+                            count = 0
+                    pc_adjust = op.impl(ctx, externals, stack)
+                    pc += op.size
+                    if (max_stack is not None
+                          and len(stack.slots) > max_stack):
+                        raise StackOverflowError(op.src, max_stack)
+                    if pc_adjust is not None:
+                        if isinstance(pc_adjust, Function):
+                            callee = pc_adjust
+                            break
+                        pc += pc_adjust
+                        if (checked and pc != return_pc
+                              and pc not in ops):
+                            raise BadJumpError(op)
+            else:
+                while pc != return_pc:
+                    op = ops[pc]
+                    pc_adjust = op.impl(ctx, externals, stack)
+                    pc += op.size
+                    if pc_adjust is not None:
+                        if isinstance(pc_adjust, Function):
+                            callee = pc_adjust
+                            break
+                        pc += pc_adjust
+
+            if callee is not None:
+                key = None
+                if cache is not None and ctx.uses_call_cache(callee):
+                    key = cache.key(callee, stack)
+                    results = cache.get(key)
+                    if results is not None:
+                        slots = stack.slots
+                        del slots[len(slots) - len(callee.ptypes):]
+                        slots.extend(results)
+                        continue
+                if (tail_calls and key is None and pc == return_pc
+                      and len(callee.rtypes) == len(rtypes)):
+                    # The callee's results are this frame's results.
+                    slots = stack.slots
+                    del slots[:len(slots) - len(callee.ptypes)]
+                else:
+                    ctx.enter_call(op)
+                    frames.append((function, pc, rtypes, stack, key))
+                    caller_stack, stack = stack, ctx.acquire_stack()
+                    caller_stack.pop_multi_onto(reversed(callee.ptypes),
+                                                stack)
+                    rtypes = callee.rtypes
+                function, pc = callee, 0
+                continue
+
+            if max_stack is not None and len(stack.slots) > max_stack:
+                raise StackOverflowError(function.bytecode, max_stack)
+            for hook in ctx.return_hooks:
+                hook(ctx, function, stack)
+            if not frames:
+                break
+            callee_stack, callee_rtypes = stack, rtypes
+            function, pc, rtypes, stack, key = frames.pop()
+            ctx.call_depth -= 1
+            if key is not None:
+                slots = callee_stack.slots
+                cache.put(key, slots[len(slots) - len(callee_rtypes):])
+            callee_stack.pop_multi_onto(callee_rtypes, stack)
+            ctx.release_stack(callee_stack)
+        if count:
+            limits.consume(count, op)
 
 class UnresolvedFunction(Function):
-    def __init__(self, referrer, unterminated):
+    def __init__(self, referrer, unterminated, decoded=None):
+        if decoded is not None:
+            Function.__init__(self, unterminated)
+            provider, name, ptypes, rtypes = decoded
+            self.set_signature(provider, name,
+                               types.decode(ptypes), types.decode(rtypes))
+            return
+
         offset, provider_o = leb128.read_uleb128(unterminated, 0)
         offset, name_o = leb128.read_uleb128(unterminated, offset)
         offset, ptypes_o = leb128.read_uleb128(unterminated, offset)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Execution Environment.
+#
+# The Infinity Note Execution Environment is free software; you can
+# redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation;
+# either version 2.1 of the License, or (at your option) any later
+# version.
+#
+# The Infinity Note Execution Environment is distributed in the hope
+# that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with the Infinity Note Execution Environment; if not,
+# see <http://www.gnu.org/licenses/>.
+
+"""Execution hooks.
+
+A hook is any object with one or more of the following methods,
+registered with Context.add_hook:
+
+  on_operation(ctx, op, stack)
+      Called before each bytecode operation is executed.
+
+  on_call(ctx, function, stack)
+      Called before a function is called, either by Context.call
+      or by a bytecode function.  The function's arguments are on
+      the top of STACK.
+
+  on_return(ctx, function, stack)
+      Called when a function is about to return.  The function's
+      results are on the top of STACK.
+
+Execution is only slowed by the events that installed hooks handle.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from ..compat import fprint
+from . import functions
+import sys
+
+class TraceHook(object):
+    """Print a trace of execution to stdout."""
+
+    def __init__(self, tracelevel=1):
+        self.tracelevel = tracelevel
+        self.__last_traced = None
+
+    def __trace(self, function, pc, stack, encoded, decoded):
+        if function != self.__last_traced:
+            fprint(sys.stdout, "\n%s:" % function)
+            self.__last_traced = function
+        if self.tracelevel > 1:
+            stack.trace(self.tracelevel)
+        fprint(sys.stdout, "  %04x: %-12s %s" % (pc, encoded, decoded))
+
+    def on_operation(self, ctx, op, stack):
+        function, pc = op.location
+        self.__trace(function, pc, stack,
+                     " ".join("%02x" % ord(c) for c in op.src.text),
+                     " ".join([op.NAMES[op.opcode]]
+                              + list(map(str, op.operands))))
+
+    def on_call(self, ctx, function, stack):
+        if not isinstance(function, functions.BytecodeFunction):
+            fprint(sys.stdout, "\n%s:" % function)
+            fprint(sys.stdout, "  NON-BYTECODE FUNCTION")
+        self.__last_traced = None
+
+    def on_return(self, ctx, function, stack):
+        if isinstance(function, functions.BytecodeFunction):
+            self.__last_traced = None
+            self.__trace(function, len(function.bytecode), stack,
+                         "", "RETURN")
+        self.__last_traced = None
+
+class CoverageHook(object):
+    """Count the number of times each operation is executed."""
+
+    def __init__(self):
+        self.hitcounts = {}
+
+    def on_operation(self, ctx, op, stack):
+        self.hitcounts[op] = self.hitcounts.get(op, 0) + 1
+
+    def coverage(self, function):
+        """Return the number of FUNCTION's operations which have
+        been executed, and the number of operations it has."""
+        ops_hit = sum(1 for op in function.ops.values()
+                      if op in self.hitcounts)
+        return ops_hit, len(function.ops)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Execution Environment.
+#
+# The Infinity Note Execution Environment is free software; you can
+# redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation;
+# either version 2.1 of the License, or (at your option) any later
+# version.
+#
+# The Infinity Note Execution Environment is distributed in the hope
+# that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with the Infinity Note Execution Environment; if not,
+# see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from . import ExecutionLimitError
+import time
+
+class Limits(object):
+    """Bounds on the execution of one Context.call.
+
+    BUDGET is the maximum number of operations which may be
+    executed, and DEADLINE is the time (as returned by time.time)
+    by which execution must complete.  Either may be None for no
+    limit.  The interpreter counts operations locally and calls
+    consume every BATCH operations, so limits are enforced to
+    within a few batches rather than exactly.
+    """
+
+    BATCH = 1024
+
+    def __init__(self, budget=None, deadline=None):
+        self.remaining = budget
+        self.deadline = deadline
+
+    def consume(self, count, op):
+        """Account for COUNT operations, the last of which was OP,
+        raising ExecutionLimitError if a limit has been exceeded."""
+        if self.remaining is not None:
+            self.remaining -= count
+            if self.remaining < 0:
+                raise ExecutionLimitError(op,
+                                          "instruction budget exceeded")
+        if self.deadline is not None and time.time() > self.deadline:
+            raise ExecutionLimitError(op, "deadline exceeded")
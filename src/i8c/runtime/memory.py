@@ -23,7 +23,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from ..compat import join_bytes
+import bisect
 import struct
 
 class Builder(object):
@@ -49,8 +49,12 @@ class Builder(object):
 
     def __exit__(self, type, value, traceback):
         if type is None:
-            # Allocate block addresses.
+            # Allocate block addresses, after any existing blocks.
             addr = 0x10000000
+            if self.mem.limit > addr:
+                addr = self.mem.limit
+                addr += 1 # empty space to catch overflows
+                addr += (16 - addr % 16) # align for printing
             for block in self.blocks:
                 block.location = addr
                 addr += block.length
@@ -166,42 +170,180 @@ class Value(object):
         bytes = struct.pack(mem.env.byteorder + self.format, value)
         mem.write(location, bytes)
 
+class Image(object):
+    """Memory and symbols built once and used by many tests.
+
+    Build an image in setUpClass using its builder, then set the
+    test class's base_image to it.  Each test's memory will start
+    as a copy of the image's, and its symbols will be registered.
+    """
+
+    def __init__(self, wordsize, byteorder):
+        self.wordsize = wordsize
+        self.byteorder = byteorder
+        self.memory = Memory(self)
+        self.symbols = {}
+
+    def builder(self):
+        return self.memory.builder()
+
+    def register_symbol(self, name, value):
+        assert not name in self.symbols
+        self.symbols[name] = value
+
+class Snapshot(object):
+    """The contents of a Memory at some point in time."""
+
+    def __init__(self, starts, extents):
+        self.starts = starts
+        self.extents = extents
+
 class Memory(object):
+    """Memory for the test environment.
+
+    Mapped memory is held as a sorted list of non-overlapping,
+    non-adjacent extents, each a contiguous bytearray.  Reading
+    any unmapped byte raises a KeyError with its location.
+
+    Extents may be shared with snapshots, and with other memories
+    restored from them.  Shared extents are copied before they are
+    extended, so taking and restoring snapshots is cheap however
+    much memory is mapped.
+    """
+
     def __init__(self, env):
         self.env = env
-        self.cells = {}
+        self.starts = []
+        self.extents = []
+        self.__owned = set()
+        self.__snapshot = None
 
     def builder(self):
         return Builder(self)
 
+    @property
+    def limit(self):
+        """The location after the last mapped byte, or 0 if no
+        memory is mapped."""
+        if not self.starts:
+            return 0
+        return self.starts[-1] + len(self.extents[-1])
+
+    # Methods to save and restore the contents
+
+    def snapshot(self):
+        """Return a Snapshot of this memory's contents."""
+        if self.__snapshot is None:
+            self.starts = tuple(self.starts)
+            self.extents = tuple(self.extents)
+            self.__owned.clear()
+            self.__snapshot = Snapshot(self.starts, self.extents)
+        return self.__snapshot
+
+    def restore(self, snapshot):
+        """Replace this memory's contents with SNAPSHOT's."""
+        self.starts, self.extents = snapshot.starts, snapshot.extents
+        self.__owned.clear()
+        self.__snapshot = snapshot
+
+    def __own(self, index):
+        """Return the extent at INDEX, copying it first if it may be
+        shared."""
+        extent = self.extents[index]
+        if id(extent) not in self.__owned:
+            extent = self.extents[index] = bytearray(extent)
+            self.__owned.add(id(extent))
+        return extent
+
+    # Methods to access the contents
+
+    def __extent_at(self, location):
+        """Return the index of the extent containing LOCATION,
+        or raise KeyError if LOCATION is not mapped."""
+        index = bisect.bisect_right(self.starts, location) - 1
+        if index < 0 or location >= (self.starts[index]
+                                     + len(self.extents[index])):
+            raise KeyError(location)
+        return index
+
+    def __locate(self, location, size):
+        """Return the extent containing the SIZE bytes at LOCATION,
+        and the offset of LOCATION within it."""
+        index = self.__extent_at(location)
+        start, extent = self.starts[index], self.extents[index]
+        offset = location - start
+        if offset + size > len(extent):
+            # Adjacent extents are merged, so the byte after
+            # this extent is unmapped.
+            raise KeyError(start + len(extent))
+        return extent, offset
+
     def getbyte(self, location):
-        try:
-            return self.cells[location]
-        except KeyError:
-            # XXX this should be an exception
-            print("getbyte(%x):\n%s" % (location, self))
-            raise
+        extent, offset = self.__locate(location, 1)
+        return extent[offset]
 
     def putbyte(self, location, value):
-        assert not location in self.cells
-        self.cells[location] = value
+        self.write(location, bytearray((value,)))
 
     def read(self, location, size):
-        return join_bytes(self.getbyte(location + offset)
-                          for offset in range(size))
+        if size == 0:
+            return b""
+        extent, offset = self.__locate(location, size)
+        return bytes(extent[offset:offset + size])
+
+    def read_mapped(self, location, size):
+        """Return up to SIZE bytes from LOCATION, stopping before
+        the first unmapped byte.  Raises KeyError if LOCATION is
+        not mapped."""
+        index = self.__extent_at(location)
+        offset = location - self.starts[index]
+        return bytes(self.extents[index][offset:offset + size])
 
     def write(self, location, bytes):
-        for byte, offset in zip(bytes, range(len(bytes))):
-            self.putbyte(location + offset, byte)
+        limit = location + len(bytes)
+        if location == limit:
+            return
+        if self.__snapshot is not None:
+            self.starts = list(self.starts)
+            self.extents = list(self.extents)
+            self.__snapshot = None
+        starts, extents = self.starts, self.extents
+        index = bisect.bisect_right(starts, location)
+        prev = index - 1
+        if prev >= 0:
+            prev_limit = starts[prev] + len(extents[prev])
+            assert prev_limit <= location
+        else:
+            prev_limit = None
+        if index < len(starts):
+            assert limit <= starts[index]
+            join_next = limit == starts[index]
+        else:
+            join_next = False
+        if prev_limit == location:
+            extent = self.__own(prev)
+            extent.extend(bytes)
+            if join_next:
+                extent.extend(extents[index])
+                del starts[index], extents[index]
+        elif join_next:
+            self.__own(index)[:0] = bytes
+            starts[index] = location
+        else:
+            extent = bytearray(bytes)
+            self.__owned.add(id(extent))
+            starts.insert(index, location)
+            extents.insert(index, extent)
 
     def __str__(self):
         tmp = {}
-        for location, content in sorted(self.cells.items()):
-            col = location % 16
-            row = location - col
-            if not row in tmp:
-                tmp[row] = [None] * 16
-            tmp[row][col] = content
+        for start, extent in zip(self.starts, self.extents):
+            for location, content in enumerate(extent, start):
+                col = location % 16
+                row = location - col
+                if not row in tmp:
+                    tmp[row] = [None] * 16
+                tmp[row][col] = content
         lines = []
         locfmt = "  %%0%dx: " % (self.env.wordsize // 4)
         lastloc = None
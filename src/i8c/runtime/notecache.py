@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Execution Environment.
+#
+# The Infinity Note Execution Environment is free software; you can
+# redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation;
+# either version 2.1 of the License, or (at your option) any later
+# version.
+#
+# The Infinity Note Execution Environment is distributed in the hope
+# that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with the Infinity Note Execution Environment; if not,
+# see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from .. import version
+from . import functions
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+
+class NoteCache(object):
+    """A persistent cache of decoded notes.
+
+    Install one by setting Context.note_cache.  Each note is
+    stored in DIRECTORY under a hash of its bytes, the versions of
+    I8X, Python and marshal, and the note's wordsize and byte order,
+    so the directory may be shared by any number of processes, ELF
+    files and Python interpreters.
+    Unreadable entries are treated as misses, and failing to write
+    an entry is not an error.
+    """
+
+    FORMAT = 1
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = self.misses = 0
+        # Marshal's format may change between Python versions.
+        self.__prefix = "%s\0%d\0%d.%d\0%d\0" % (
+            version(), self.FORMAT, sys.version_info[0],
+            sys.version_info[1], marshal.version)
+
+    def __filename(self, note):
+        digest = hashlib.sha1(("%s%d%s\0" % (
+            self.__prefix, note.wordsize,
+            note.byteorder.decode("utf-8"))).encode("utf-8"))
+        digest.update(note.memory)
+        digest = digest.hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def load(self, note, lazy=False):
+        """Return the function NOTE decodes to.  LAZY is passed to
+        the BytecodeFunction constructor."""
+        filename = self.__filename(note)
+        try:
+            with open(filename, "rb") as fp:
+                decoded = marshal.load(fp)
+            function = functions.BytecodeFunction(note, decoded, lazy)
+        except (EnvironmentError, EOFError, TypeError, ValueError):
+            function = None
+        if function is not None:
+            self.hits += 1
+            return function
+        self.misses += 1
+        function = functions.BytecodeFunction(note)
+        self.__store(filename, function)
+        return function
+
+    def __store(self, filename, function):
+        dir = os.path.dirname(filename)
+        tmpfile = None
+        try:
+            if not os.path.isdir(dir):
+                os.makedirs(dir)
+            fd, tmpfile = tempfile.mkstemp(dir=dir)
+            with os.fdopen(fd, "wb") as fp:
+                marshal.dump(function.decoded, fp)
+            os.rename(tmpfile, filename)
+        except EnvironmentError:
+            if tmpfile is not None and os.path.exists(tmpfile):
+                os.unlink(tmpfile)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Execution Environment.
+#
+# The Infinity Note Execution Environment is free software; you can
+# redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation;
+# either version 2.1 of the License, or (at your option) any later
+# version.
+#
+# The Infinity Note Execution Environment is distributed in the hope
+# that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with the Infinity Note Execution Environment; if not,
+# see <http://www.gnu.org/licenses/>.
+
+
+"""Indexes of the notes which define each function.
+
+An index is a dictionary mapping each function signature to a list
+of (filename, offset) pairs, one for each note defining a function
+with that signature, where offset is the location of the note's
+contents within the ELF file.  Context.import_notes and
+Context.import_many return indexes, and they may be saved to and
+loaded from sidecar files using save and load.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from .. import version
+from . import ELFFileError, InputFileError
+from . import elffile
+from . import functions
+import json
+import os
+import tempfile
+
+FORMAT = 1
+
+def add(index, signature, filename, offset):
+    """Record that the note at OFFSET in FILENAME defines a
+    function with signature SIGNATURE."""
+    index.setdefault(signature, []).append((filename, offset))
+
+def merge(index, other):
+    """Add every entry of the index OTHER to INDEX."""
+    for signature, locations in other.items():
+        index.setdefault(signature, []).extend(locations)
+
+def search(paths):
+    """Yield the names of the files in PATHS, each of which is the
+    name of a file or of a directory whose files are included."""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                filename = os.path.join(path, name)
+                if os.path.isfile(filename):
+                    yield filename
+        else:
+            yield path
+
+def scan(paths):
+    """Return an index of the notes in the ELF files in PATHS, which
+    are searched as described for search.  Files in directories
+    which are not ELF files are ignored.  Only the signatures of the
+    notes are decoded."""
+    index = {}
+    explicit = set(paths)
+    for filename in search(paths):
+        try:
+            ef = elffile.open(filename)
+        except ELFFileError:
+            if filename in explicit:
+                raise
+            continue
+        filename = os.path.abspath(filename)
+        for note in ef.infinity_notes:
+            function = functions.BytecodeFunction(note, lazy=True)
+            add(index, function.signature, filename, note.start)
+    return index
+
+def save(index, filename):
+    """Write INDEX to the file FILENAME."""
+    data = {"format": FORMAT,
+            "version": version(),
+            "signatures": dict((signature, [list(location)
+                                            for location in locations])
+                               for signature, locations in index.items())}
+    fd, tmpfile = tempfile.mkstemp(dir=os.path.dirname(filename) or ".")
+    try:
+        with os.fdopen(fd, "w") as fp:
+            json.dump(data, fp, sort_keys=True)
+        os.rename(tmpfile, filename)
+    except:
+        os.unlink(tmpfile)
+        raise
+
+def load(filename):
+    """Return the index saved in the file FILENAME."""
+    try:
+        with open(filename) as fp:
+            data = json.load(fp)
+        if data["format"] != FORMAT:
+            raise ValueError
+        return dict((signature, [(location[0], location[1])
+                                 for location in locations])
+                    for signature, locations in data["signatures"].items())
+    except EnvironmentError as e:
+        raise InputFileError(filename, e.strerror)
+    except (KeyError, TypeError, ValueError, IndexError):
+        raise InputFileError(filename, "not a note index")
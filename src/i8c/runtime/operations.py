@@ -119,6 +119,22 @@ class Operation(object):
         constants.DW_OP_ne: (operator.ne, 2, True),
     }
 
+    # Operations whose results depend only on their operands.
+    PURE = set(OPTABLE.keys())
+    PURE.update(range(constants.DW_OP_lit0, constants.DW_OP_lit31 + 1))
+    PURE.update(range(constants.DW_OP_const1u, constants.DW_OP_consts + 1))
+    PURE.update((constants.DW_OP_bra,
+                 constants.DW_OP_drop,
+                 constants.DW_OP_dup,
+                 constants.DW_OP_over,
+                 constants.DW_OP_pick,
+                 constants.DW_OP_plus_uconst,
+                 constants.DW_OP_rot,
+                 constants.DW_OP_skip,
+                 constants.DW_OP_swap,
+                 constants.I8_OP_call,
+                 constants.I8_OP_load_external))
+
     FIXEDSIZE = {}
     for code in "bBhHiIqQ":
         code = bytes(code.encode("utf-8"))
@@ -145,37 +161,48 @@ class Operation(object):
             sizecode = self.FIXEDSIZE.get(type, None)
             if sizecode is not None:
                 size, fmt = sizecode
-                fmt = src.byteorder + fmt
-                value = struct.unpack(fmt, next[:size].bytes)[0]
+                value = next.unpack(fmt)[0]
             else:
                 size, value = getattr(self, "decode_" + type)(next)
             self.operands.append(value)
             next += size
         # Store our source location for exceptions
         self.src = src[:next.start - src.start]
-        # Store our location and encoded form for tracing
+        self.__setup(function, pc)
+
+    @classmethod
+    def restore(cls, function, pc, size, opcode, operands):
+        """Create an operation from previously decoded values."""
+        op = cls.__new__(cls)
+        op.opcode = opcode
+        op.operands = list(operands)
+        op.src = function.bytecode[pc:pc + size]
+        op.__setup(function, pc)
+        return op
+
+    def __setup(self, function, pc):
+        self.size = len(self.src)
+        # Store our location for tracing
         self.location = (function, pc)
-        self.encoded = self.src.text
-        # Counter for coverage checks
-        self.hitcount = 0
-
-    @property
-    def size(self):
-        return len(self.src)
+        # Bind our implementation
+        self.impl = self.__select_impl()
 
     @property
     def byteorder(self):
         return self.src.byteorder
 
+    @property
+    def is_pure(self):
+        return self.opcode in self.PURE
+
     @property
     def function(self):
         return self.location[0]
 
     @staticmethod
     def decode_address(code):
-        fmt = code.byteorder + {32: b"I", 64: b"Q"}[code.wordsize]
-        size = struct.calcsize(fmt)
-        return size, struct.unpack(fmt, code[:size].bytes)[0]
+        fmt = {32: b"I", 64: b"Q"}[code.wordsize]
+        return struct.calcsize(fmt), code.unpack(fmt)[0]
 
     @staticmethod
     def decode_uleb128(code):
@@ -196,78 +223,105 @@ class Operation(object):
         assert len(self.operands) == 1
         return self.operands[0]
 
-    def __trace(self, ctx, stack):
-        ctx.trace_operation(self.location, stack,
-                            " ".join("%02x" % ord(c)
-                                     for c in self.encoded),
-                            " ".join([self.NAMES[self.opcode]]
-                                     + list(map(str, self.operands))))
+    def __select_impl(self):
+        """Return a callable that will execute this operation.
 
-    def execute(self, ctx, externals, stack):
-        self.__trace(ctx, stack)
-        self.hitcount += 1
+        This is called once, when the operation is decoded, so that
+        executing the operation does not need to look anything up.
+        """
         if (self.opcode >= constants.DW_OP_lit0
               and self.opcode <= constants.DW_OP_lit31):
-            impl = self.__exec_litN
+            return self.__constant_impl(self.opcode - constants.DW_OP_lit0)
         elif (self.opcode >= constants.DW_OP_const1u
               and self.opcode <= constants.DW_OP_consts):
-            impl = self.__exec_constX
+            return self.__constant_impl(self.operand)
         elif self.opcode in self.OPTABLE:
-            impl = self.__exec_optable
-        else:
-            impl = getattr(self, "exec_" + self.name, None)
+            func, num_args, is_signed = self.OPTABLE[self.opcode]
+            if num_args == 2:
+                return self.__binary_impl(func, is_signed)
+            else:
+                assert num_args == 1
+                return self.__unary_impl(func, is_signed)
+        impl = getattr(self, "exec_" + self.name, None)
         if impl is None:
-            raise NotImplementedError(self.name)
-        return impl(ctx, externals, stack)
-
-    def __exec_optable(self, ctx, externals, stack):
-        func, num_args, is_signed = self.OPTABLE[self.opcode]
-        pop = is_signed and stack.pop_signed or stack.pop_unsigned
-        if num_args == 2:
-            impl = self.__exec_binary
-        else:
-            assert num_args == 1
-            impl = self.__exec_unary
-        return impl(ctx, externals, stack, func, pop)
+            impl = self.__unimplemented
+        return impl
 
-    def __exec_unary(self, ctx, externals, stack, func, pop):
-        stack.push_intptr(func(pop()))
+    def __unimplemented(self, ctx, externals, stack):
+        raise NotImplementedError(self.name)
 
-    def __exec_binary(self, ctx, externals, stack, func, pop):
-        b = pop()
-        a = pop()
-        stack.push_intptr(func(a, b))
+    @staticmethod
+    def __constant_impl(value):
+        def impl(ctx, externals, stack):
+            stack.push_intptr(value)
+        return impl
+
+    @staticmethod
+    def __unary_impl(func, is_signed):
+        if is_signed:
+            def impl(ctx, externals, stack):
+                stack.push_intptr(func(stack.pop_signed()))
+        else:
+            def impl(ctx, externals, stack):
+                stack.push_intptr(func(stack.pop_unsigned()))
+        return impl
+
+    @staticmethod
+    def __binary_impl(func, is_signed):
+        if is_signed:
+            def impl(ctx, externals, stack):
+                b = stack.pop_signed()
+                a = stack.pop_signed()
+                stack.push_intptr(func(a, b))
+        else:
+            def impl(ctx, externals, stack):
+                b = stack.pop_unsigned()
+                a = stack.pop_unsigned()
+                stack.push_intptr(func(a, b))
+        return impl
 
     def exec_addr(self, ctx, externals, stack):
+        stack.push_intptr(self.lookup_address(ctx))
+
+    def lookup_address(self, ctx):
         exception = None
         for name in self.src[1:].symbol_names:
             try:
-                value = ctx.env.lookup_symbol(name)
+                return ctx.env.lookup_symbol(name)
             except KeyError as e:
                 exception = e
                 continue
-            stack.push_intptr(value)
-            return
         assert exception is not None
         raise exception
 
-    def __exec_constX(self, ctx, externals, stack):
-        stack.push_intptr(self.operand)
-
     def exec_bra(self, ctx, externals, stack):
         if stack.pop_unsigned() != 0:
             return self.operand
 
     def exec_deref(self, ctx, externals, stack):
-        self.__exec_deref(ctx, externals, stack, 0)
+        stack.push_intptr(self.deref(ctx, stack.pop_unsigned()))
 
     def exec_deref_size(self, ctx, externals, stack):
-        self.__exec_deref(ctx, externals, stack, self.operand)
+        stack.push_intptr(self.deref(ctx, stack.pop_unsigned()))
 
     def exec_deref_int(self, ctx, externals, stack):
-        self.__exec_deref(ctx, externals, stack, self.operand)
+        stack.push_intptr(self.deref(ctx, stack.pop_unsigned()))
 
-    def __exec_deref(self, ctx, externals, stack, size):
+    def deref(self, ctx, address):
+        fmt = self.deref_format(ctx)
+        try:
+            result = ctx.read_memory(fmt, address)
+        except KeyError as e:
+            raise BadDerefError(self, ctx.env.memory, e.args[0])
+        return struct.unpack(fmt, result)[0]
+
+    def deref_format(self, ctx):
+        """Return the struct format of the value this operation
+        dereferences."""
+        if self.opcode == constants.DW_OP_deref:
+            size = 0
+        else:
+            size = self.operand
         if size == 0:
             size = ctx.wordsize // 8
         is_signed = size < 0
@@ -276,60 +330,52 @@ class Operation(object):
         sizecode = "%s%d" % (is_signed and "s" or "u", size)
         sizecode = self.FIXEDSIZE.get(sizecode, None)
         if sizecode is None:
-            raise UnhandledNoteError(self)
+            raise UnhandledNoteError(self.src)
         check, fmt = sizecode
         assert check == size
-        fmt = self.byteorder + fmt
-        try:
-            result = ctx.env.read_memory(fmt, stack.pop_unsigned())
-        except KeyError as e:
-            raise BadDerefError(self, ctx.env.memory, e.args[0])
-        stack.push_intptr(struct.unpack(fmt, result)[0])
+        return self.byteorder + fmt
 
     def exec_drop(self, ctx, externals, stack):
-        stack.pop_boxed()
+        stack.drop()
 
     def exec_dup(self, ctx, externals, stack):
-        stack.push_boxed(stack.slots[0])
+        stack.pick(0)
 
     def exec_call(self, ctx, externals, stack):
         callee = stack.pop_function()
-        ctx.trace_call(callee, stack)
-        callee.execute(ctx, stack)
-
-    def __exec_litN(self, ctx, externals, stack):
-        stack.push_intptr(self.opcode - constants.DW_OP_lit0)
+        for hook in ctx.call_hooks:
+            hook(ctx, callee, stack)
+        if ctx.interprets(callee):
+            # The interpreter will enter the callee itself.
+            return callee
+        ctx.enter_call(self)
+        try:
+            ctx.invoke(callee, stack)
+        finally:
+            ctx.call_depth -= 1
 
     def exec_load_external(self, ctx, externals, stack):
         if self.operand == 0:
-            external = self.function.type, self.function
+            stack.push_typed(self.function.type, self.function)
         else:
-            external = externals[self.operand - 1].resolve(ctx)
-        stack.push_typed(*external)
+            stack.push_typed(*ctx.resolve_external(
+                externals[self.operand - 1]))
 
     def exec_over(self, ctx, externals, stack):
-        stack.push_boxed(stack.slots[1])
+        stack.pick(1)
 
     def exec_pick(self, ctx, externals, stack):
-        stack.push_boxed(stack.slots[self.operand])
+        stack.pick(self.operand)
 
     def exec_plus_uconst(self, ctx, externals, stack):
         a = stack.pop_unsigned()
         stack.push_intptr(a + self.operand)
 
     def exec_rot(self, ctx, externals, stack):
-        a = stack.pop_boxed()
-        b = stack.pop_boxed()
-        c = stack.pop_boxed()
-        stack.push_boxed(a)
-        stack.push_boxed(c)
-        stack.push_boxed(b)
+        stack.rot()
 
     def exec_skip(self, ctx, externals, stack):
         return self.operand
 
     def exec_swap(self, ctx, externals, stack):
-        a = stack.pop_boxed()
-        b = stack.pop_boxed()
-        stack.push_boxed(a)
-        stack.push_boxed(b)
+        stack.swap()
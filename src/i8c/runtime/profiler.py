@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Execution Environment.
+#
+# The Infinity Note Execution Environment is free software; you can
+# redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation;
+# either version 2.1 of the License, or (at your option) any later
+# version.
+#
+# The Infinity Note Execution Environment is distributed in the hope
+# that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with the Infinity Note Execution Environment; if not,
+# see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import time
+
+try:
+    clock = time.perf_counter
+except AttributeError: # pragma: no cover
+    clock = time.time
+
+class Profiler(object):
+    """An execution hook which records a profile.
+
+    Install one with Context.start_profiling.  The profiler counts
+    the operations executed by opcode, by function and by location,
+    and records the number of calls to each function together with
+    the wall-clock time spent in it, both including ("cumulative")
+    and excluding ("self") the time spent in the functions it calls.
+    Profiles from other processes may be added with merge.
+    """
+
+    def __init__(self):
+        self.__ops = {}
+        self.__locations = {}
+        self.__functions = {}
+        self.__frames = []
+        self.__active = {}
+
+    def on_operation(self, ctx, op, stack):
+        ops = self.__ops
+        ops[op] = ops.get(op, 0) + 1
+
+    def on_call(self, ctx, function, stack):
+        signature = function.signature
+        self.__active[signature] = self.__active.get(signature, 0) + 1
+        self.__frames.append([signature, clock(), 0.0])
+
+    def on_return(self, ctx, function, stack):
+        now = clock()
+        signature = function.signature
+        # Frames may be left behind by calls which raised exceptions.
+        while self.__frames:
+            frame = self.__frames.pop()
+            self.__active[frame[0]] -= 1
+            if frame[0] == signature:
+                break
+        else:
+            return
+        signature, start, children = frame
+        elapsed = now - start
+        stats = self.__function_stats(signature)
+        stats[0] += 1
+        if not self.__active[signature]:
+            # Only the outermost of recursive calls is cumulative.
+            stats[1] += elapsed
+        stats[2] += elapsed - children
+        if self.__frames:
+            self.__frames[-1][2] += elapsed
+
+    def __function_stats(self, signature):
+        stats = self.__functions.get(signature, None)
+        if stats is None:
+            stats = self.__functions[signature] = [0, 0.0, 0.0]
+        return stats
+
+    # Methods to access the recorded profile
+
+    @property
+    def locations(self):
+        """A dictionary mapping (signature, pc, opcode name) to the
+        number of times the operation there was executed."""
+        result = dict(self.__locations)
+        for op, count in self.__ops.items():
+            function, pc = op.location
+            key = (function.signature, pc, op.name)
+            result[key] = result.get(key, 0) + count
+        return result
+
+    @property
+    def opcodes(self):
+        """A dictionary mapping opcode names to the number of
+        operations with that opcode executed."""
+        result = {}
+        for (signature, pc, name), count in self.locations.items():
+            result[name] = result.get(name, 0) + count
+        return result
+
+    @property
+    def functions(self):
+        """A dictionary mapping function signatures to dictionaries
+        of calls, operations executed, and cumulative and self time
+        in seconds."""
+        result = {}
+        for signature, (calls, cumulative, self_time) \
+                in self.__functions.items():
+            result[signature] = {"calls": calls,
+                                 "instructions": 0,
+                                 "cumulative": cumulative,
+                                 "self": self_time}
+        for (signature, pc, name), count in self.locations.items():
+            if signature not in result:
+                result[signature] = {"calls": 0,
+                                     "instructions": 0,
+                                     "cumulative": 0.0,
+                                     "self": 0.0}
+            result[signature]["instructions"] += count
+        return result
+
+    def as_dict(self):
+        """Return the profile as a dictionary of builtin types."""
+        return {"opcodes": self.opcodes,
+                "functions": self.functions,
+                "locations": sorted([signature, pc, name, count]
+                                    for (signature, pc, name), count
+                                    in self.locations.items())}
+
+    def as_json(self):
+        """Return the profile as a JSON string."""
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+    def merge(self, profile):
+        """Add a profile returned by as_dict to this one."""
+        for signature, pc, name, count in profile["locations"]:
+            key = (signature, pc, name)
+            self.__locations[key] = self.__locations.get(key, 0) + count
+        for signature, stats in profile["functions"].items():
+            ours = self.__function_stats(signature)
+            ours[0] += stats["calls"]
+            ours[1] += stats["cumulative"]
+            ours[2] += stats["self"]
+
+    def format_table(self, limit=20):
+        """Return the profile as text tables sorted by self time
+        and by count, listing at most LIMIT locations."""
+        functions = sorted(self.functions.items(),
+                           key=lambda item: (-item[1]["self"],
+                                             -item[1]["instructions"],
+                                             item[0]))
+        width = max([len("Function")] + [len(signature)
+                                          for signature, stats
+                                          in functions])
+        lines = ["%-*s %8s %12s %12s %12s" % (width, "Function",
+                                               "Calls", "Operations",
+                                               "Cumulative", "Self")]
+        for signature, stats in functions:
+            lines.append("%-*s %8d %12d %12.6f %12.6f" % (
+                width, signature, stats["calls"],
+                stats["instructions"], stats["cumulative"],
+                stats["self"]))
+
+        lines.extend(("", "%-20s %12s" % ("Opcode", "Operations")))
+        for name, count in sorted(self.opcodes.items(),
+                                  key=lambda item: (-item[1], item[0])):
+            lines.append("%-20s %12d" % (name, count))
+
+        lines.extend(("", "%-*s %12s" % (width + 25, "Location",
+                                          "Operations")))
+        locations = sorted(self.locations.items(),
+                           key=lambda item: (-item[1], item[0]))
+        for (signature, pc, name), count in locations[:limit]:
+            location = "%s+%04x %s" % (signature, pc, name)
+            lines.append("%-*s %12d" % (width + 25, location, count))
+        return "\n".join(lines)
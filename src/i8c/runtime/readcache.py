@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Execution Environment.
+#
+# The Infinity Note Execution Environment is free software; you can
+# redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation;
+# either version 2.1 of the License, or (at your option) any later
+# version.
+#
+# The Infinity Note Execution Environment is distributed in the hope
+# that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with the Infinity Note Execution Environment; if not,
+# see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import struct
+
+class ReadCache(object):
+    """A cache of pages of the environment's memory.
+
+    Install one by setting Context.read_cache.  Dereferences are
+    answered from PAGESIZE-byte aligned pages, which are fetched
+    using the environment's read_memory_block(address, size) hook.
+    The least recently used page is discarded when the cache holds
+    more than MAXPAGES pages.  If PER_CALL is True the cache is
+    invalidated at the start of every Context.call; otherwise the
+    user must call invalidate whenever memory may have changed.
+
+    read_memory_block may return fewer bytes than were requested
+    if the memory after them is unmapped.  If the start of a page
+    is unmapped, the part of the page from the address being read
+    is fetched instead, so pages may be cached in several parts.
+    Reads which cannot be satisfied from the cache, for example
+    because the environment has no read_memory_block hook, are
+    passed to read_memory uncached.
+    """
+
+    def __init__(self, pagesize=4096, maxpages=256, per_call=True):
+        assert pagesize > 0 and pagesize & (pagesize - 1) == 0
+        self.pagesize = pagesize
+        self.maxpages = maxpages
+        self.per_call = per_call
+        self.hits = self.misses = 0
+        self.__pages = OrderedDict()
+
+    def __len__(self):
+        return len(self.__pages)
+
+    @property
+    def hit_rate(self):
+        """The fraction of reads answered without fetching."""
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+    def invalidate(self):
+        """Discard all cached pages."""
+        self.__pages.clear()
+
+    def __part(self, env, address):
+        """Return (start, bytes, fetched) for a cached part of the
+        page containing ADDRESS which includes ADDRESS, fetching it
+        if necessary."""
+        number = address // self.pagesize
+        parts = self.__pages.pop(number, None)
+        if parts is None:
+            parts = []
+        self.__pages[number] = parts
+        if len(self.__pages) > self.maxpages:
+            self.__pages.popitem(last=False)
+        for start, data in parts:
+            if start <= address < start + len(data):
+                return start, data, False
+        limit = (number + 1) * self.pagesize
+        start = number * self.pagesize
+        if not parts:
+            try:
+                data = env.read_memory_block(start, limit - start)
+            except KeyError:
+                data = b""
+            if data:
+                parts.append((start, data))
+                if address < start + len(data):
+                    return start, data, True
+        start = address
+        data = env.read_memory_block(start, limit - start)
+        if not data:
+            raise KeyError(address)
+        # Discard any parts this one contains.
+        end = start + len(data)
+        parts[:] = [part for part in parts
+                    if not (start <= part[0]
+                            and part[0] + len(part[1]) <= end)]
+        parts.append((start, data))
+        return start, data, True
+
+    def read_memory(self, env, fmt, address):
+        """Return the bytes of the value with struct format FMT
+        at ADDRESS, as the read_memory environment hook does."""
+        limit = address + struct.calcsize(fmt)
+        result, location, fetched = [], address, False
+        try:
+            if not hasattr(env, "read_memory_block"):
+                raise KeyError(address)
+            while location < limit:
+                start, data, part_fetched = self.__part(env, location)
+                fetched = fetched or part_fetched
+                end = min(start + len(data), limit)
+                result.append(data[location - start:end - start])
+                location = end
+        except KeyError:
+            self.misses += 1
+            return env.read_memory(fmt, address)
+        if fetched:
+            self.misses += 1
+        else:
+            self.hits += 1
+        if len(result) == 1:
+            return result[0]
+        return b"".join(result)
@@ -25,16 +25,22 @@ from __future__ import unicode_literals
 
 from ..compat import fprint, integer
 from . import functions
-from . import types
-import ctypes
 import sys
 
 # XXX most every assert here should be a proper error
 
 class Stack(object):
+    """A stack of values.
+
+    Values are stored in "slots" with the top of the stack at the
+    end.  Integers are stored as unsigned Python ints, wrapped to
+    the wordsize; functions and opaque values are stored as the
+    Function and Opaque objects that represent them.
+    """
+
     def __init__(self, wordsize):
-        self.__sint_t = getattr(ctypes, "c_int%d" % wordsize)
-        self.__uint_t = getattr(ctypes, "c_uint%d" % wordsize)
+        self.mask = (1 << wordsize) - 1
+        self.signbit = 1 << (wordsize - 1)
         self.slots = []
 
     # Generic push and pop
@@ -60,32 +66,53 @@ class Stack(object):
 
     def push_typed(self, type, value):
         assert type is not None
-        self.push_boxed(self.__box(type, value))
+        self.slots.append(self.__box(type, value))
 
     def pop_typed(self, type):
         assert type is not None
-        return self.__unbox(type, self.pop_boxed())
+        return self.__unbox(type, self.slots.pop())
+
+    # Raw values, as stored in slots.
 
-    def push_boxed(self, boxed_value):
-        assert not isinstance(boxed_value, integer)
-        self.slots.insert(0, boxed_value)
+    def push_raw(self, value):
+        self.slots.append(value)
 
-    def pop_boxed(self):
-        return self.slots.pop(0)
+    def pop_raw(self):
+        return self.slots.pop()
 
     # Push and pop shortcuts
 
     def push_intptr(self, value):
-        self.push_typed(types.IntPtrType, value)
+        self.slots.append(value & self.mask)
 
     def pop_unsigned(self):
-        return self.pop_typed(types.IntPtrType)
+        value = self.slots.pop()
+        assert isinstance(value, integer)
+        return value
 
     def pop_signed(self):
-        return self.__sint_t(self.pop_unsigned()).value
+        signbit = self.signbit
+        return (self.pop_unsigned() ^ signbit) - signbit
 
     def pop_function(self):
-        return self.__unbox_FUNCTION(None, self.pop_boxed())
+        return self.__unbox_FUNCTION(None, self.slots.pop())
+
+    # Stack manipulation
+
+    def drop(self):
+        del self.slots[-1]
+
+    def pick(self, index):
+        slots = self.slots
+        slots.append(slots[-1 - index])
+
+    def swap(self):
+        slots = self.slots
+        slots[-1], slots[-2] = slots[-2], slots[-1]
+
+    def rot(self):
+        slots = self.slots
+        slots[-1], slots[-2], slots[-3] = slots[-2], slots[-3], slots[-1]
 
     # Boxing and unboxing
 
@@ -99,11 +126,11 @@ class Stack(object):
 
     def __box_INTPTR(self, type, value):
         assert isinstance(value, integer)
-        return self.__uint_t(value)
+        return value & self.mask
 
     def __unbox_INTPTR(self, type, boxed):
-        assert isinstance(boxed, self.__uint_t)
-        return boxed.value
+        assert isinstance(boxed, integer)
+        return boxed
 
     def __box_FUNCTION(self, type, value):
         if not isinstance(value, functions.Function):
@@ -132,9 +159,11 @@ class Stack(object):
 
     def trace(self, tracelevel):
         depth = tracelevel + 1
-        for item, index in zip(self.slots[:depth], range(depth)):
-            if isinstance(item, self.__uint_t):
-                value = item.value
+        items = self.slots[-depth:]
+        items.reverse()
+        for item, index in zip(items, range(depth)):
+            if isinstance(item, integer):
+                value = item
                 item = "%d" % value
                 if value < 0 or value > 15:
                     item += " (0x%x)" % value
@@ -37,10 +37,16 @@ except ImportError: # pragma: no cover
     import unittest
 
 class BaseTestCase(unittest.TestCase):
+    # A memory.Image each test's memory and symbols are copied from.
+    base_image = None
+
     def run(self, *args, **kwargs):
         self.memory = memory.Memory(self)
         self.addCleanup(delattr, self, "memory")
         self.__symbols = {}
+        if self.base_image is not None:
+            self.memory.restore(self.base_image.memory.snapshot())
+            self.__symbols.update(self.base_image.symbols)
         return unittest.TestCase.run(self, *args, **kwargs)
 
     def register_symbol(self, name, value):
@@ -56,6 +62,12 @@ class BaseTestCase(unittest.TestCase):
         """Hook method for reading bytes from memory."""
         return self.memory.read(addr, struct.calcsize(fmt))
 
+    def read_memory_block(self, addr, size):
+        """Hook method for reading blocks of memory for caching.
+        Returns fewer than SIZE bytes if the memory after them is
+        unmapped."""
+        return self.memory.read_mapped(addr, size)
+
 class TestCase(BaseTestCase):
     include_path = []
 
@@ -95,6 +107,11 @@ class TestCase(BaseTestCase):
             except:
                 raise HeaderFileError(filename, linenumber)
 
+    @classmethod
+    def new_image(cls):
+        """Return a new memory.Image for this context's target."""
+        return memory.Image(cls.i8ctx.wordsize, cls.i8ctx.byteorder)
+
     def run(self, *args, **kwargs):
         self.addCleanup(self.__restore_env, self.i8ctx.env)
         self.i8ctx.env = self
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Execution Environment.
+#
+# The Infinity Note Execution Environment is free software; you can
+# redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation;
+# either version 2.1 of the License, or (at your option) any later
+# version.
+#
+# The Infinity Note Execution Environment is distributed in the hope
+# that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with the Infinity Note Execution Environment; if not,
+# see <http://www.gnu.org/licenses/>.
+
+"""Translation of bytecode functions into Python functions.
+
+A translated function takes the context followed by the function's
+arguments (deepest first) and returns a tuple of its results, again
+deepest first.  Stack slots become local variables named by their
+depth, so "s0" is the bottom of the stack.  Integers are held as
+unsigned Python ints, wrapped to the function's wordsize.
+
+Only functions which passed verification are translated, using the
+stack states the verifier determined; the interpreter should be used
+for all other functions.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from .. import constants
+from .verifier import DEREF_OPS
+
+class UntranslatableError(Exception):
+    """The function cannot be translated."""
+
+BINARY_OPS = {
+    constants.DW_OP_and: "%(a)s & %(b)s",
+    constants.DW_OP_div: "((%(sa)s) // (%(sb)s)) & %(mask)d",
+    constants.DW_OP_minus: "(%(a)s - %(b)s) & %(mask)d",
+    constants.DW_OP_mod: "%(a)s %% %(b)s",
+    constants.DW_OP_mul: "(%(a)s * %(b)s) & %(mask)d",
+    constants.DW_OP_or: "%(a)s | %(b)s",
+    constants.DW_OP_plus: "(%(a)s + %(b)s) & %(mask)d",
+    constants.DW_OP_shl: "(%(a)s << %(b)s) & %(mask)d",
+    constants.DW_OP_shr: "%(a)s >> %(b)s",
+    constants.DW_OP_shra: "((%(sa)s) >> (%(sb)s)) & %(mask)d",
+    constants.DW_OP_xor: "%(a)s ^ %(b)s",
+    constants.DW_OP_eq: "1 if %(a)s == %(b)s else 0",
+    constants.DW_OP_ge: "1 if %(sa)s >= %(sb)s else 0",
+    constants.DW_OP_gt: "1 if %(sa)s > %(sb)s else 0",
+    constants.DW_OP_le: "1 if %(sa)s <= %(sb)s else 0",
+    constants.DW_OP_lt: "1 if %(sa)s < %(sb)s else 0",
+    constants.DW_OP_ne: "1 if %(a)s != %(b)s else 0",
+}
+
+UNARY_OPS = {
+    constants.DW_OP_abs: "abs(%(sa)s) & %(mask)d",
+    constants.DW_OP_neg: "-%(a)s & %(mask)d",
+    constants.DW_OP_not: "%(a)s ^ %(mask)d",
+}
+
+def call_function(ctx, op, callee, args, is_tail_call):
+    """Call CALLEE from a translated function.  OP is the call
+    operation, and IS_TAIL_CALL is True if the caller returns the
+    callee's results; as in the interpreter, such calls do not
+    count towards the call depth limit."""
+    if not is_tail_call:
+        ctx.enter_call(op)
+    try:
+        if ctx.call_cache is None:
+            pycode = ctx.pycode_for(callee)
+            if pycode is not None:
+                ctx.translated_depth += 1
+                try:
+                    return pycode(ctx, *args)
+                finally:
+                    ctx.translated_depth -= 1
+        stack = ctx.new_stack()
+        for value in args:
+            stack.push_raw(value)
+        ctx.invoke(callee, stack)
+        results = [stack.pop_raw() for type in callee.rtypes]
+        results.reverse()
+        return tuple(results)
+    finally:
+        if not is_tail_call:
+            ctx.call_depth -= 1
+
+class Translator(object):
+    def __init__(self, function):
+        self.function = function
+        self.wordsize = function.src.wordsize
+        self.mask = (1 << self.wordsize) - 1
+        self.signbit = 1 << (self.wordsize - 1)
+        self.return_pc = len(function.bytecode)
+        self.namespace = {"call_function": call_function}
+
+    def translate(self):
+        verification = self.function.verification
+        if verification is None:
+            raise UntranslatableError
+        self.states = verification.states
+        self.leaders = verification.leaders
+        self.targets = verification.targets
+        source = "\n".join(self.__generate()) + "\n"
+        filename = "<i8x:%s>" % self.function.signature
+        exec(compile(source, filename, "exec"), self.namespace)
+        result = self.namespace["translated"]
+        result.source = source
+        return result
+
+    # Code generation
+
+    def __generate(self):
+        nargs = len(self.function.ptypes)
+        yield "def translated(%s):" % ", ".join(["ctx"]
+                                                + self.__slots(0, nargs))
+        blocks = sorted(pc for pc in self.leaders if pc in self.states)
+        if not blocks:
+            for line in self.__goto(0, nargs, "    "):
+                yield line
+        elif blocks == [0] and 0 not in self.targets:
+            for line in self.__block(0, "    "):
+                yield line
+        else:
+            # Blocks are tested in order, so jumping forwards does
+            # not need another trip around the loop.
+            yield "    pc = 0"
+            yield "    while True:"
+            for start in blocks:
+                yield "        if pc == %d:" % start
+                for line in self.__block(start, " " * 12):
+                    yield line
+
+    def __block(self, pc, indent):
+        depth = len(self.states[pc])
+        while True:
+            op = self.function.ops[pc]
+            next_pc = pc + op.size
+            if op.opcode == constants.DW_OP_bra:
+                target = next_pc + op.operand
+                depth -= 1
+                yield "%sif %s:" % (indent, self.__slot(depth))
+                for line in self.__goto(target, depth, indent + "    "):
+                    yield line
+                yield "%selse:" % indent
+                for line in self.__goto(next_pc, depth, indent + "    "):
+                    yield line
+                return
+            elif op.opcode == constants.DW_OP_skip:
+                target = next_pc + op.operand
+                for line in self.__goto(target, depth, indent):
+                    yield line
+                return
+            line, depth = self.__statement(op, depth)
+            if line is not None:
+                yield indent + line
+            if next_pc == self.return_pc or next_pc in self.leaders:
+                for line in self.__goto(next_pc, depth, indent):
+                    yield line
+                return
+            pc = next_pc
+
+    def __goto(self, pc, depth, indent):
+        if pc == self.return_pc:
+            results = self.__slots(depth - len(self.function.rtypes), depth)
+            yield "%sreturn (%s)" % (indent, "".join(result + ","
+                                                     for result in results))
+        else:
+            yield "%spc = %d" % (indent, pc)
+
+    def __statement(self, op, depth):
+        """Return a line of code implementing OP and the stack depth
+        after it has executed."""
+        opcode = op.opcode
+        if opcode in BINARY_OPS:
+            a, b = self.__slots(depth - 2, depth)
+            return (self.__assign(a, BINARY_OPS[opcode], a, b), depth - 1)
+        elif opcode in UNARY_OPS:
+            a = self.__slot(depth - 1)
+            return (self.__assign(a, UNARY_OPS[opcode], a), depth)
+        elif opcode == constants.DW_OP_plus_uconst:
+            a = self.__slot(depth - 1)
+            return ("%s = (%s + %d) & %d" % (a, a, op.operand, self.mask),
+                    depth)
+        elif constants.DW_OP_lit0 <= opcode <= constants.DW_OP_lit31:
+            return ("%s = %d" % (self.__slot(depth),
+                                 opcode - constants.DW_OP_lit0),
+                    depth + 1)
+        elif constants.DW_OP_const1u <= opcode <= constants.DW_OP_consts:
+            return ("%s = %d" % (self.__slot(depth),
+                                 op.operand & self.mask),
+                    depth + 1)
+        elif opcode == constants.DW_OP_addr:
+            return ("%s = %s.lookup_address(ctx) & %d"
+                    % (self.__slot(depth), self.__bind(op), self.mask),
+                    depth + 1)
+        elif opcode in DEREF_OPS:
+            a = self.__slot(depth - 1)
+            return ("%s = %s.deref(ctx, %s) & %d"
+                    % (a, self.__bind(op), a, self.mask),
+                    depth)
+        elif opcode == constants.DW_OP_drop:
+            return None, depth - 1
+        elif opcode == constants.DW_OP_dup:
+            return self.__pick(depth, 0)
+        elif opcode == constants.DW_OP_over:
+            return self.__pick(depth, 1)
+        elif opcode == constants.DW_OP_pick:
+            return self.__pick(depth, op.operand)
+        elif opcode == constants.DW_OP_swap:
+            a, b = self.__slots(depth - 2, depth)
+            return "%s, %s = %s, %s" % (a, b, b, a), depth
+        elif opcode == constants.DW_OP_rot:
+            a, b, c = self.__slots(depth - 3, depth)
+            return "%s, %s, %s = %s, %s, %s" % (a, b, c, c, a, b), depth
+        elif opcode == constants.I8_OP_load_external:
+            if op.operand == 0:
+                value = self.__bind(self.function)
+            else:
+                value = "ctx.resolve_external(%s)[1]" % self.__bind(
+                    self.function.externals[op.operand - 1])
+            return "%s = %s" % (self.__slot(depth), value), depth + 1
+        elif opcode == constants.I8_OP_call:
+            pc = op.location[1]
+            type = self.states[pc][-1]
+            nargs, nresults = len(type.ptypes), len(type.rtypes)
+            base = depth - 1 - nargs
+            args = self.__slots(base, depth - 1)
+            results = self.__slots(base, base + nresults)
+            is_tail_call = (pc + op.size == self.return_pc
+                            and nresults == len(self.function.rtypes))
+            call = "call_function(ctx, %s, %s, (%s), %s)" % (
+                self.__bind(op), self.__slot(depth - 1),
+                "".join(arg + "," for arg in args), is_tail_call)
+            if results:
+                call = "%s, = %s" % (", ".join(results), call)
+            return call, base + nresults
+        raise AssertionError
+
+    def __assign(self, target, template, a, b=None):
+        values = {"a": a, "b": b, "mask": self.mask,
+                  "sa": "(%s ^ %d) - %d" % (a, self.signbit, self.signbit)}
+        if b is not None:
+            values["sb"] = "(%s ^ %d) - %d" % (b, self.signbit, self.signbit)
+        return "%s = %s" % (target, template % values)
+
+    def __pick(self, depth, index):
+        return ("%s = %s" % (self.__slot(depth),
+                             self.__slot(depth - 1 - index)),
+                depth + 1)
+
+    def __bind(self, value):
+        """Make VALUE available to the generated code."""
+        name = "k%d" % len(self.namespace)
+        self.namespace[name] = value
+        return name
+
+    @staticmethod
+    def __slot(index):
+        return "s%d" % index
+
+    def __slots(self, start, limit):
+        return [self.__slot(index) for index in range(start, limit)]
+
+def translate(function):
+    """Return a Python function equivalent to FUNCTION, or None if
+    FUNCTION cannot be translated."""
+    if not hasattr(function, "bytecode"):
+        return None
+    try:
+        return Translator(function).translate()
+    except UntranslatableError:
+        return None
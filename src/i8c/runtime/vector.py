@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Execution Environment.
+#
+# The Infinity Note Execution Environment is free software; you can
+# redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation;
+# either version 2.1 of the License, or (at your option) any later
+# version.
+#
+# The Infinity Note Execution Environment is distributed in the hope
+# that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with the Infinity Note Execution Environment; if not,
+# see <http://www.gnu.org/licenses/>.
+
+"""Lane-parallel evaluation of functions using NumPy.
+
+Straight-line functions which only manipulate integers are executed
+once for many sets of arguments, with every stack slot held as an
+array with one element per set of arguments.  NumPy is optional;
+without it, or for functions which cannot be evaluated this way,
+call_many returns None and the caller should use the interpreter.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from .. import constants
+from . import types
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
+
+class UnvectorizableError(Exception):
+    """The function cannot be evaluated this way."""
+
+UNSIGNED_BINARY_OPS = {
+    constants.DW_OP_and: lambda a, b: a & b,
+    constants.DW_OP_minus: lambda a, b: a - b,
+    constants.DW_OP_mul: lambda a, b: a * b,
+    constants.DW_OP_or: lambda a, b: a | b,
+    constants.DW_OP_plus: lambda a, b: a + b,
+    constants.DW_OP_xor: lambda a, b: a ^ b,
+    constants.DW_OP_eq: lambda a, b: a == b,
+    constants.DW_OP_ne: lambda a, b: a != b,
+}
+
+SIGNED_BINARY_OPS = {
+    constants.DW_OP_ge: lambda a, b: a >= b,
+    constants.DW_OP_gt: lambda a, b: a > b,
+    constants.DW_OP_le: lambda a, b: a <= b,
+    constants.DW_OP_lt: lambda a, b: a < b,
+}
+
+class Lanes(object):
+    def __init__(self, function, count):
+        self.function = function
+        self.count = count
+        self.wordsize = function.src.wordsize
+        self.mask = numpy.uint64((1 << self.wordsize) - 1)
+        if self.wordsize < 64:
+            self.signbit = numpy.int64(1 << (self.wordsize - 1))
+        self.stack = []
+
+    def constant(self, value):
+        return numpy.full(self.count, value & int(self.mask),
+                          dtype=numpy.uint64)
+
+    def signed(self, array):
+        if self.wordsize == 64:
+            return array.view(numpy.int64)
+        return (array.astype(numpy.int64) ^ self.signbit) - self.signbit
+
+    def unsigned(self, array):
+        if array.dtype == numpy.bool_:
+            return array.astype(numpy.uint64)
+        if array.dtype == numpy.int64:
+            array = array.view(numpy.uint64)
+        return array & self.mask
+
+    def pop(self, count=1):
+        if count > len(self.stack):
+            raise UnvectorizableError
+        result = self.stack[len(self.stack) - count:]
+        del self.stack[len(self.stack) - count:]
+        return result
+
+    def run(self, rows):
+        for index in range(len(self.function.ptypes)):
+            self.stack.append(self.constant(0))
+            self.stack[-1][:] = [row[index] & int(self.mask)
+                                 for row in rows]
+        ops = sorted(self.function.ops.items())
+        with numpy.errstate(all="ignore"):
+            for pc, op in ops:
+                self.execute(op)
+        if not self.function.rtypes:
+            return [[] for row in rows]
+        results = self.pop(len(self.function.rtypes))
+        results.reverse()
+        return [list(row) for row in zip(*[array.tolist()
+                                           for array in results])]
+
+    def execute(self, op):
+        opcode = op.opcode
+        if opcode in UNSIGNED_BINARY_OPS:
+            a, b = self.pop(2)
+            result = UNSIGNED_BINARY_OPS[opcode](a, b)
+        elif opcode in SIGNED_BINARY_OPS:
+            a, b = map(self.signed, self.pop(2))
+            result = SIGNED_BINARY_OPS[opcode](a, b)
+        elif opcode == constants.DW_OP_div:
+            a, b = map(self.signed, self.pop(2))
+            if not b.all():
+                raise UnvectorizableError
+            result = a // b
+        elif opcode == constants.DW_OP_mod:
+            a, b = self.pop(2)
+            if not b.all():
+                raise UnvectorizableError
+            result = a % b
+        elif opcode in (constants.DW_OP_shl, constants.DW_OP_shr):
+            a, b = self.pop(2)
+            limit = numpy.uint64(self.wordsize - 1)
+            if opcode == constants.DW_OP_shl:
+                result = a << numpy.minimum(b, limit)
+            else:
+                result = a >> numpy.minimum(b, limit)
+            result = numpy.where(b > limit, numpy.uint64(0), result)
+        elif opcode == constants.DW_OP_shra:
+            a, b = map(self.signed, self.pop(2))
+            if (b < 0).any():
+                raise UnvectorizableError
+            result = a >> numpy.minimum(b, numpy.int64(63))
+        elif opcode == constants.DW_OP_abs:
+            result = numpy.abs(self.signed(self.pop()[0]))
+        elif opcode == constants.DW_OP_neg:
+            result = ~self.pop()[0] + numpy.uint64(1)
+        elif opcode == constants.DW_OP_not:
+            result = ~self.pop()[0]
+        elif opcode == constants.DW_OP_plus_uconst:
+            result = self.pop()[0] + numpy.uint64(op.operand & int(self.mask))
+        elif constants.DW_OP_lit0 <= opcode <= constants.DW_OP_lit31:
+            result = self.constant(opcode - constants.DW_OP_lit0)
+        elif constants.DW_OP_const1u <= opcode <= constants.DW_OP_consts:
+            result = self.constant(op.operand)
+        elif opcode == constants.DW_OP_drop:
+            self.pop()
+            return
+        elif opcode in (constants.DW_OP_dup,
+                        constants.DW_OP_over,
+                        constants.DW_OP_pick):
+            index = {constants.DW_OP_dup: 0,
+                     constants.DW_OP_over: 1}.get(opcode, None)
+            if index is None:
+                index = op.operand
+            if index >= len(self.stack):
+                raise UnvectorizableError
+            result = self.stack[-1 - index]
+        elif opcode == constants.DW_OP_swap:
+            a, b = self.pop(2)
+            self.stack.extend((b, a))
+            return
+        elif opcode == constants.DW_OP_rot:
+            a, b, c = self.pop(3)
+            self.stack.extend((c, a, b))
+            return
+        else:
+            raise UnvectorizableError
+        self.stack.append(self.unsigned(result))
+
+def is_vectorizable(function):
+    """Return True if FUNCTION's bytecode could be evaluated lanewise.
+    Some functions may still be rejected during evaluation, for
+    example if they would divide by zero."""
+    if not hasattr(function, "bytecode"):
+        return False
+    for type in function.ptypes + function.rtypes:
+        if (isinstance(type, types.FunctionType)
+              or not issubclass(type, types.IntPtrType)):
+            return False
+    for op in function.ops.values():
+        if op.opcode in (constants.DW_OP_bra, constants.DW_OP_skip):
+            return False
+        if not op.is_pure or op.opcode in (constants.I8_OP_call,
+                                           constants.I8_OP_load_external):
+            return False
+    return True
+
+def call_many(function, rows):
+    """Evaluate FUNCTION for every argument tuple in ROWS, returning a
+    list of result lists, or None if FUNCTION cannot be evaluated
+    lanewise."""
+    if numpy is None or not rows or not is_vectorizable(function):
+        return None
+    nargs = len(function.ptypes)
+    if any(len(row) != nargs for row in rows):
+        return None
+    try:
+        return Lanes(function, len(rows)).run(rows)
+    except UnvectorizableError:
+        return None
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Execution Environment.
+#
+# The Infinity Note Execution Environment is free software; you can
+# redistribute it and/or modify it under the terms of the GNU Lesser
+# General Public License as published by the Free Software Foundation;
+# either version 2.1 of the License, or (at your option) any later
+# version.
+#
+# The Infinity Note Execution Environment is distributed in the hope
+# that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with the Infinity Note Execution Environment; if not,
+# see <http://www.gnu.org/licenses/>.
+
+
+"""Load-time verification of bytecode functions.
+
+The verifier determines the stack at the start of every reachable
+instruction of a function, checking that every jump lands on an
+instruction boundary within the function, that the stack depth and
+slot types agree wherever control flow merges, that no operation
+can underflow the stack, and that calls match the types of the
+functions being called.  Functions which pass may be executed
+without the interpreter's per-operation checks, and are candidates
+for translation into Python.  Functions whose stack can become
+deeper than their note's max_stack, or which can return values
+other than those of their return types, are corrupt.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from .. import constants
+from . import CorruptNoteError
+from . import StackOverflowError
+from . import types
+
+class VerificationError(Exception):
+    """The function could not be verified."""
+
+INT = types.IntPtrType
+OPAQUE = types.OpaqueType
+
+BINARY_OPS = (
+    constants.DW_OP_and,
+    constants.DW_OP_div,
+    constants.DW_OP_minus,
+    constants.DW_OP_mod,
+    constants.DW_OP_mul,
+    constants.DW_OP_or,
+    constants.DW_OP_plus,
+    constants.DW_OP_shl,
+    constants.DW_OP_shr,
+    constants.DW_OP_shra,
+    constants.DW_OP_xor,
+    constants.DW_OP_eq,
+    constants.DW_OP_ge,
+    constants.DW_OP_gt,
+    constants.DW_OP_le,
+    constants.DW_OP_lt,
+    constants.DW_OP_ne,
+)
+
+UNARY_OPS = (
+    constants.DW_OP_abs,
+    constants.DW_OP_neg,
+    constants.DW_OP_not,
+    constants.DW_OP_plus_uconst,
+)
+
+DEREF_OPS = (constants.DW_OP_deref,
+             constants.DW_OP_deref_size,
+             constants.I8_OP_deref_int)
+
+def same_type(a, b):
+    if isinstance(a, types.FunctionType):
+        return isinstance(b, types.FunctionType) and a == b
+    return a is b
+
+def slot_type(type):
+    if isinstance(type, types.FunctionType):
+        return type
+    if issubclass(type, INT):
+        return INT
+    assert type is OPAQUE
+    return type
+
+class Verifier(object):
+    """The result of verifying a function.
+
+    After verification, STATES maps the location of every reachable
+    instruction to a tuple of the slot types on the stack before it
+    executes, deepest first.  LEADERS holds the locations at which
+    basic blocks start, TARGETS those which are jumped to, and
+    MAX_DEPTH is the deepest the stack can become.
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.return_pc = len(function.bytecode)
+
+    def verify(self):
+        self.states = {}
+        self.leaders = set([0])
+        self.targets = set()
+        entry = tuple(map(slot_type, self.function.ptypes))
+        self.max_depth = len(entry)
+        max_stack = self.function.max_stack
+        pending = [(0, entry)]
+        while pending:
+            pc, state = pending.pop()
+            if len(state) > self.max_depth:
+                self.max_depth = len(state)
+                if max_stack is not None and self.max_depth > max_stack:
+                    raise StackOverflowError(self.function.bytecode + pc,
+                                             max_stack)
+            if pc == self.return_pc:
+                self.__check_return(state)
+                continue
+            op = self.function.ops.get(pc, None)
+            if op is None:
+                raise VerificationError
+            if not self.__merge(pc, state):
+                continue
+            for next_pc, next_state in self.__successors(op, list(state)):
+                pending.append((next_pc, tuple(next_state)))
+        return self
+
+    def __check_return(self, state):
+        """Raise CorruptNoteError unless STATE, the stack at the end
+        of the function, holds values of the function's rtypes."""
+        rtypes = self.function.rtypes
+        if len(state) < len(rtypes):
+            raise CorruptNoteError(self.function.bytecode)
+        results = reversed(state[len(state) - len(rtypes):])
+        if not all(map(same_type, results, map(slot_type, rtypes))):
+            raise CorruptNoteError(self.function.bytecode)
+
+    def __merge(self, pc, state):
+        """Record STATE for PC, returning True if it was new."""
+        existing = self.states.get(pc, None)
+        if existing is None:
+            self.states[pc] = state
+            return True
+        if (len(existing) != len(state)
+              or not all(map(same_type, existing, state))):
+            raise VerificationError
+        return False
+
+    def __successors(self, op, stack):
+        next_pc = op.location[1] + op.size
+        opcode = op.opcode
+        if opcode in BINARY_OPS:
+            self.__pop(stack, INT, INT)
+            stack.append(INT)
+        elif opcode in UNARY_OPS or opcode in DEREF_OPS:
+            self.__pop(stack, INT)
+            stack.append(INT)
+        elif (constants.DW_OP_lit0 <= opcode <= constants.DW_OP_lit31
+              or constants.DW_OP_const1u <= opcode <= constants.DW_OP_consts
+              or opcode == constants.DW_OP_addr):
+            stack.append(INT)
+        elif opcode == constants.DW_OP_drop:
+            self.__pop(stack, None)
+        elif opcode in (constants.DW_OP_dup,
+                        constants.DW_OP_over,
+                        constants.DW_OP_pick):
+            index = {constants.DW_OP_dup: 0,
+                     constants.DW_OP_over: 1}.get(opcode, None)
+            if index is None:
+                index = op.operand
+            if index >= len(stack):
+                raise VerificationError
+            stack.append(stack[-1 - index])
+        elif opcode == constants.DW_OP_swap:
+            if len(stack) < 2:
+                raise VerificationError
+            stack[-1], stack[-2] = stack[-2], stack[-1]
+        elif opcode == constants.DW_OP_rot:
+            if len(stack) < 3:
+                raise VerificationError
+            stack[-1], stack[-2], stack[-3] = stack[-2], stack[-3], stack[-1]
+        elif opcode == constants.I8_OP_load_external:
+            if op.operand == 0:
+                stack.append(self.function.type)
+            elif op.operand <= len(self.function.externals):
+                stack.append(self.function.externals[op.operand - 1].type)
+            else:
+                raise VerificationError
+        elif opcode == constants.I8_OP_call:
+            type = self.__pop(stack, None)[0]
+            if not isinstance(type, types.FunctionType):
+                raise VerificationError
+            self.__pop(stack, *map(slot_type, type.ptypes))
+            stack.extend(map(slot_type, reversed(type.rtypes)))
+        elif opcode == constants.DW_OP_bra:
+            self.__pop(stack, INT)
+            target = next_pc + op.operand
+            self.__add_leaders(target, next_pc)
+            self.targets.add(target)
+            return ((target, stack), (next_pc, stack))
+        elif opcode == constants.DW_OP_skip:
+            target = next_pc + op.operand
+            self.__add_leaders(target, next_pc)
+            self.targets.add(target)
+            return ((target, stack),)
+        else:
+            raise VerificationError
+        return ((next_pc, stack),)
+
+    def __pop(self, stack, *expect):
+        """Pop values of the types in EXPECT from STACK.  EXPECT is
+        ordered deepest first, and None matches any type."""
+        if len(expect) > len(stack):
+            raise VerificationError
+        popped = stack[len(stack) - len(expect):]
+        del stack[len(stack) - len(expect):]
+        for actual, expected in zip(popped, expect):
+            if expected is not None and not same_type(actual, expected):
+                raise VerificationError
+        return popped
+
+    def __add_leaders(self, *pcs):
+        for pc in pcs:
+            if pc < 0 or pc > self.return_pc:
+                raise VerificationError
+            self.leaders.add(pc)
+
+def verify(function):
+    """Return the result of verifying FUNCTION, or None if FUNCTION
+    has no bytecode or could not be verified.  Raises
+    StackOverflowError if FUNCTION's stack can exceed its max_stack,
+    or CorruptNoteError if FUNCTION can return values which do not
+    match its return types."""
+    if not hasattr(function, "bytecode"):
+        return None
+    try:
+        return Verifier(function).verify()
+    except VerificationError:
+        return None
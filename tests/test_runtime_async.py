@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c import runtime
+import struct
+import time
+try:
+    import asyncio
+except ImportError: # pragma: no cover
+    asyncio = None
+try:
+    import unittest2 as unittest
+except ImportError: # pragma: no cover
+    import unittest
+
+SOURCE = """\
+define test::read_sym returns int
+    argument int x
+    extern ptr sym1
+    extern func int (int, int) test::add
+    deref sym1, u32
+    call add
+
+define test::add_one returns int
+    argument int x
+    add 1
+
+define test::twice returns int
+    argument int x
+    call read_sym
+    call read_sym
+"""
+
+DELAY = 0.05
+
+class AsyncEnv(object):
+    """An environment whose hooks complete after DELAY seconds."""
+
+    def __init__(self, byteorder):
+        self.byteorder = byteorder
+        self.memory = "(no memory)"
+
+    def lookup_symbol(self, name):
+        assert name == "sym1"
+        return asyncio.sleep(DELAY, result=0x1000)
+
+    def read_memory(self, fmt, address):
+        if address != 0x1000:
+            raise KeyError(address)
+        return asyncio.sleep(DELAY, result=struct.pack(fmt, 5))
+
+    def call_test_add(self, a, b):
+        return asyncio.sleep(DELAY, result=a + b)
+
+@unittest.skipIf(asyncio is None
+                 or not hasattr(runtime, "AsyncContext"),
+                 "asyncio is not available")
+class TestRuntimeAsync(TestCase):
+    def __context(self):
+        tree, output = self.compile(SOURCE)
+        ctx = runtime.AsyncContext()
+        ctx.import_notes(output.fileprefix + ".o")
+        ctx.env = AsyncEnv(ctx.byteorder)
+        return ctx
+
+    def __run(self, awaitable, *args):
+        """Run AWAITABLE(*ARGS) to completion on a new event loop."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            return loop.run_until_complete(awaitable(*args))
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    def test_call(self):
+        """Check that asynchronous environment hooks are awaited."""
+        ctx = self.__context()
+        self.assertEqual(self.__run(ctx.call, "test::twice(i)i", 1),
+                         [11])
+
+    def test_concurrency(self):
+        """Check that calls run concurrently."""
+        ctx = self.__context()
+        start = time.time()
+        results = self.__run(asyncio.gather,
+                             *[ctx.call("test::read_sym(i)i", x)
+                               for x in range(50)])
+        self.assertEqual(results, [[x + 5] for x in range(50)])
+        # Each call waits 3 * DELAY seconds in total.
+        self.assertLess(time.time() - start, 50 * DELAY)
+
+    def test_call_many(self):
+        """Check that call_many awaits every call."""
+        ctx = self.__context()
+        for signature, offset in (("test::add_one(i)i", 1),
+                                  ("test::twice(i)i", 10)):
+            self.assertEqual(self.__run(ctx.call_many, signature,
+                                        [(x,) for x in range(3)]),
+                             [[x + offset] for x in range(3)])
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import ExecutionLimitError
+from i8c.runtime.callcache import CallCache
+import sys
+
+SOURCE = """\
+define test::fibonacci returns int
+    argument int n
+
+    dup
+    bge 2, recurse
+    return
+
+recurse:
+    dup
+    sub 1
+    call fibonacci
+    swap
+    sub 2
+    call fibonacci
+    add
+
+define test::read_sym returns int
+    extern ptr sym1
+    deref sym1, u32
+
+define test::use_read_sym returns int
+    argument int x
+    call read_sym
+    add
+
+define test::square returns int
+    argument int x
+    dup
+    mul
+
+define test::tail_square returns int
+    argument int x
+    call square
+
+define test::apply returns int
+    argument func int (int) f
+    argument int x
+    load f
+    call
+"""
+
+FIBONACCI = "test::fibonacci(i)i"
+
+class TestRuntimeCallCache(TestCase):
+    def test_purity(self):
+        """Check that pure functions are identified."""
+        tree, output = self.compile(SOURCE)
+        for signature, expect in ((FIBONACCI, True),
+                                  ("test::read_sym()i", False),
+                                  ("test::use_read_sym(i)i", False),
+                                  ("test::apply(Fi(i)i)i", False)):
+            function = output.get_function(signature)
+            self.assertEqual(output.is_pure(function), expect)
+
+    def test_call_cache(self):
+        """Check that pure function calls are cached."""
+        tree, output = self.compile(SOURCE)
+        cache = output.call_cache = CallCache(maxsize=8)
+        self.assertEqual(output.call(FIBONACCI, 10), [55])
+        self.assertEqual((cache.hits, cache.misses), (8, 11))
+        self.assertEqual(output.call(FIBONACCI, 11), [89])
+        self.assertEqual((cache.hits, cache.misses), (10, 12))
+        self.assertEqual(output.call(FIBONACCI, 11), [89])
+        self.assertEqual((cache.hits, cache.misses), (11, 12))
+        self.assertEqual(len(cache), 8)
+        output.register_function(output.get_function(FIBONACCI))
+        self.assertEqual(len(cache), 0)
+
+    def test_deep_recursion(self):
+        """Check that cached recursion is not limited by Python's
+        stack, but by the context's call depth limit."""
+        tree, output = self.compile(SOURCE)
+        cache = output.call_cache = CallCache()
+        depth = sys.getrecursionlimit() * 2
+        a, b = 0, 1
+        for x in range(depth):
+            a, b = b, (a + b) & ((1 << output.wordsize) - 1)
+        self.assertEqual(output.call(FIBONACCI, depth), [a])
+        self.assertEqual(cache.misses, depth + 1)
+        output.call_depth_limit = 10
+        self.assertRaises(ExecutionLimitError,
+                          output.call, FIBONACCI, depth + 20)
+        self.assertEqual(output.call_depth, 0)
+
+    def test_tail_call_cached(self):
+        """Check that the results of pure tail calls are cached."""
+        tree, output = self.compile(SOURCE)
+        cache = output.call_cache = CallCache()
+        self.assertEqual(output.call("test::tail_square(i)i", 7), [49])
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        self.assertEqual(output.call("test::square(i)i", 7), [49])
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_impure_not_cached(self):
+        """Check that impure function calls are not cached."""
+        tree, output = self.compile(SOURCE)
+        with self.memory.builder() as mem:
+            sym = mem.alloc("sym1")
+            sym.store_u32(0, 5)
+        cache = output.call_cache = CallCache()
+        for x in range(3):
+            self.assertEqual(output.call("test::use_read_sym(i)i", 3), [8])
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
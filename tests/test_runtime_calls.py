@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import ExecutionLimitError
+from i8c.runtime import types
+from i8c.runtime.callcache import CallCache
+import sys
+
+SOURCE = """\
+define test::depth returns int
+    argument int x
+
+    dup
+    bne 0, recurse
+    return
+
+recurse:
+    sub 1
+    call depth
+    add 1
+
+define test::count returns int
+    argument int x
+    argument int y
+
+    dup
+    beq 0, done
+    sub 1
+    swap
+    add 1
+    swap
+    call count
+    return
+
+done:
+    drop
+"""
+
+DEPTH = "test::depth(i)i"
+COUNT = "test::count(ii)i"
+
+TAIL_SOURCE = """\
+define test::inner returns int
+    argument int x
+    add 1
+
+define test::middle returns int
+    argument int x
+    call inner
+
+define test::outer returns int
+    argument int x
+    call middle
+    add 1
+"""
+
+class TestRuntimeCalls(TestCase):
+    def __compile(self):
+        """Compile SOURCE, yielding the result configured to execute
+        calls in each of the ways a context can."""
+        tree, output = self.compile(SOURCE)
+        for translate_notes in (False, True):
+            for call_cache in (None, CallCache()):
+                output.translate_notes = translate_notes
+                output.call_cache = call_cache
+                yield output
+
+    def test_deep_recursion(self):
+        """Check that recursion is not limited by Python's stack."""
+        for output in self.__compile():
+            depth = sys.getrecursionlimit() * 2
+            self.assertEqual(output.call(DEPTH, depth), [depth])
+
+    def test_depth_limit(self):
+        """Check that the call depth limit is enforced."""
+        for output in self.__compile():
+            output.call_depth_limit = 10
+            self.assertRaises(ExecutionLimitError,
+                              output.call, DEPTH, 11)
+            self.assertEqual(output.call_depth, 0)
+            self.assertEqual(output.call(DEPTH, 10), [10])
+
+    def test_tail_calls(self):
+        """Check that tail calls do not consume call depth."""
+        for output in self.__compile():
+            # Calls whose results are cached are not tail calls.
+            output.call_cache = None
+            output.call_depth_limit = 10
+            self.assertEqual(output.call(COUNT, 0, 50000), [50000])
+
+    def test_cached_tail_call(self):
+        """Check that a cached function called in tail position has
+        its results cached."""
+        tree, output = self.compile(TAIL_SOURCE)
+        cache = output.call_cache = CallCache()
+        self.assertEqual(output.call("test::middle(i)i", 1), [2])
+        misses = cache.misses
+        self.assertEqual(output.call("test::inner(i)i", 1), [2])
+        self.assertEqual((cache.hits, cache.misses), (1, misses))
+
+    def test_tail_call_rtypes(self):
+        """Check that the results of a tail call are returned as the
+        types of the function it replaced."""
+        tree, output = self.compile(TAIL_SOURCE)
+        output.get_function("test::inner(i)i").rtypes = [types.OpaqueType]
+        self.assertEqual(output.call("test::outer(i)i", 1), [3])
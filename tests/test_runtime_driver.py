@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.compat import StringIO
+from i8c.runtime import driver
+from i8c import runtime
+from i8c.runtime import ExecutionLimitError, I8XError
+import json
+import os
+import re
+import shutil
+import sys
+
+SOURCE = """\
+define test::square returns int
+    argument int x
+    dup
+    mul
+
+define test::sum_squares returns int
+    argument int x
+
+    dup
+    bne 0, recurse
+    return
+
+recurse:
+    dup
+    call square
+    swap
+    sub 1
+    call sum_squares
+    add
+"""
+
+SUM_SQUARES = "test::sum_squares(i)i"
+
+# The same functions as SOURCE, split between two files so that
+# notes loaded on demand must load others.
+LIBRARY_SOURCES = ("""\
+define test::square returns int
+    argument int x
+    dup
+    mul
+""", """\
+define test::sum_squares returns int
+    argument int x
+    extern func int (int) test::square
+
+    dup
+    bne 0, recurse
+    return
+
+recurse:
+    dup
+    call square
+    swap
+    sub 1
+    call sum_squares
+    add
+""")
+
+# A loop which only execution limits can stop.
+SPIN_SOURCE = """\
+define test::spin returns int
+    argument int x
+
+loop:
+    add 1
+    goto loop
+"""
+
+TESTFILE = """\
+from i8c.runtime import TestCase
+
+class TestCall(TestCase):
+    def test_call(self):
+        self.assertEqual(self.i8ctx.call(%r, %d), [%d])
+"""
+
+class TestRuntimeDriver(TestCase):
+    def setUp(self):
+        self.saved_stdout = sys.stdout
+        self.saved_i8ctx = getattr(runtime.TestCase, "i8ctx", None)
+
+    def tearDown(self):
+        sys.stdout = self.saved_stdout
+        runtime.TestCase.i8ctx = self.saved_i8ctx
+
+    def __run_i8x(self, args):
+        sys.stdout = output = StringIO()
+        try:
+            status = driver.main(args)
+        finally:
+            sys.stdout = self.saved_stdout
+        return status, output.getvalue()
+
+    def __write_testfiles(self, output, cases):
+        filenames = []
+        for index, case in enumerate(cases):
+            filename = "%s_%d.i8x" % (output.fileprefix, index)
+            with open(filename, "w") as fp:
+                fp.write(TESTFILE % case)
+            filenames.append(filename)
+        return filenames
+
+    def __compile_library(self):
+        """Compile LIBRARY_SOURCES, returning the output of the last
+        and a directory containing only their object files."""
+        outputs = [self.compile(source)[1] for source in LIBRARY_SOURCES]
+        libdir = outputs[-1].fileprefix + ".lib"
+        if os.path.exists(libdir):
+            shutil.rmtree(libdir)
+        os.mkdir(libdir)
+        for output in outputs:
+            shutil.copy(output.fileprefix + ".o", libdir)
+        return outputs[-1], libdir
+
+    def test_parallel(self):
+        """Check that test files may be run in parallel."""
+        tree, output = self.compile(SOURCE)
+        objfile = output.fileprefix + ".o"
+        testfiles = self.__write_testfiles(
+            output, ((SUM_SQUARES, 0, 0), (SUM_SQUARES, 0, 0)))
+        status, serial = self.__run_i8x(["-i", objfile] + testfiles)
+        self.assertIs(status, None)
+        self.assertIn("Coverage:", serial)
+        status, parallel = self.__run_i8x(["-j", "2", "-i", objfile]
+                                          + testfiles)
+        self.assertIs(status, None)
+        coverage = serial[serial.index("Coverage:"):]
+        self.assertTrue(parallel.endswith(coverage))
+        # The merged coverage should be complete.
+        testfiles += self.__write_testfiles(
+            output, ((SUM_SQUARES, 5, 55),))[-1:]
+        status, parallel = self.__run_i8x(["-j", "3", "-i", objfile]
+                                          + testfiles)
+        self.assertIs(status, None)
+        self.assertNotIn("Coverage:", parallel)
+
+    def test_parallel_library_path(self):
+        """Check that -L works when test files are run in parallel."""
+        output, libdir = self.__compile_library()
+        testfiles = self.__write_testfiles(
+            output, ((SUM_SQUARES, 0, 0), (SUM_SQUARES, 0, 0)))
+        status, serial = self.__run_i8x(["-L", libdir] + testfiles)
+        self.assertIs(status, None)
+        self.assertIn("Coverage:", serial)
+        status, parallel = self.__run_i8x(["-j", "2", "-L", libdir]
+                                          + testfiles)
+        self.assertIs(status, None)
+        coverage = serial[serial.index("Coverage:"):]
+        self.assertTrue(parallel.endswith(coverage))
+
+    def test_parallel_failure(self):
+        """Check that failures in parallel runs are reported."""
+        tree, output = self.compile(SOURCE)
+        objfile = output.fileprefix + ".o"
+        testfiles = self.__write_testfiles(
+            output, ((SUM_SQUARES, 0, 0), (SUM_SQUARES, 3, 5)))
+        results = []
+        for jobs in ("1", "2"):
+            status, result = self.__run_i8x(["-j", jobs, "-i", objfile]
+                                            + testfiles)
+            self.assertEqual(status, 1)
+            self.assertEqual(result.count("Ran 2 tests in "), 1)
+            self.assertIn("FAILED (failures=1)", result)
+            # Only the time taken should differ.
+            results.append(re.sub(r"Ran 2 tests in \S+", "", result))
+        self.assertEqual(results[0], results[1])
+
+    def test_profile(self):
+        """Check that profiles from parallel runs are merged."""
+        tree, output = self.compile(SOURCE)
+        objfile = output.fileprefix + ".o"
+        testfiles = self.__write_testfiles(
+            output, ((SUM_SQUARES, 3, 14), (SUM_SQUARES, 4, 30)))
+        profiles = []
+        for jobs in ("1", "2"):
+            jsonfile = "%s_%s.json" % (output.fileprefix, jobs)
+            status, result = self.__run_i8x(["-j", jobs, "-i", objfile,
+                                              "--profile-json", jsonfile]
+                                             + testfiles)
+            self.assertIs(status, None)
+            self.assertIn("Profile:", result)
+            with open(jsonfile) as fp:
+                profiles.append(json.load(fp))
+        serial, parallel = profiles
+        self.assertEqual(serial["opcodes"], parallel["opcodes"])
+        self.assertEqual(serial["locations"], parallel["locations"])
+        self.assertEqual(parallel["functions"]["test::square(i)i"]
+                         ["calls"], 7)
+
+    def test_budget(self):
+        """Check that i8x can limit execution."""
+        tree, output = self.compile(SPIN_SOURCE)
+        objfile = output.fileprefix + ".o"
+        args = ["-i", objfile, "-q", "test::spin(i)i", "0"]
+        self.assertRaises(ExecutionLimitError, self.__run_i8x,
+                          ["--budget=20"] + args)
+        self.assertRaises(ExecutionLimitError, self.__run_i8x,
+                          ["--timeout=0.1"] + args)
+        self.assertRaises(I8XError, self.__run_i8x, ["--timeout=0"] + args)
+
+    def test_library_path(self):
+        """Check that -L imports notes on demand."""
+        output, libdir = self.__compile_library()
+        status, result = self.__run_i8x(["-q", "-L", libdir,
+                                         SUM_SQUARES, "5"])
+        self.assertIs(status, None)
+        self.assertEqual(result.strip(), "55")
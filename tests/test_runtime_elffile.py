@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.compiler import commands
+from i8c.runtime import elffile
+from i8c.runtime import noteindex
+from i8c.runtime import ELFFileError
+import struct
+import subprocess
+
+SOURCE = """\
+define test::func1 returns int
+    load 1
+
+define test::func2 returns int
+    load 2
+"""
+
+RELOC_SOURCE = """\
+define test::read_sym returns ptr
+    extern ptr sym1
+    load sym1
+"""
+
+DATA_ASM = b"""\
+	.globl foo
+	.data
+	.long 1
+foo:	.long 0
+	.long foo+4
+"""
+
+ADDEND_ASM = b"""\
+	.globl foo
+	.data
+	.quad 1
+foo:	.quad 0
+	.quad foo+8
+	.quad foo-8
+"""
+
+SHARED_ASM = b"""\
+	.globl foo
+	.data
+	.quad 1
+foo:	.quad 0
+	.quad foo+8
+	.text
+	.globl func
+func:	call bar@PLT
+	ret
+	.section .note.GNU-stack, "", @progbits
+"""
+
+# A GNU property note, whose type is the same as NT_GNU_INFINITY.
+PROPERTY_ASM = b"""\
+	.section .note.gnu.property, "a", "note"
+	.balign 8
+	.long 4
+	.long 16
+	.long 5
+	.asciz "GNU"
+	.long 0xc0000002
+	.long 4
+	.long 3
+	.balign 8
+"""
+
+class TestRuntimeELFFile(TestCase):
+    def test_notes(self):
+        """Check that notes are located using the section headers."""
+        tree, output = self.compile(SOURCE)
+        ef = elffile.open(output.fileprefix + ".o")
+        names = [section.name for section in ef.sections]
+        self.assertIn(".note.infinity", names)
+        notes = list(ef.infinity_notes)
+        self.assertEqual(len(notes), 2)
+        self.assertEqual(sorted(note.bytes for note in notes),
+                         sorted(note.src.bytes for note in output.notes))
+
+    def __reassemble(self, output, suffix, section):
+        """Assemble OUTPUT's notes into section SECTION of a new
+        object file with a GNU property note."""
+        asmfile = output.fileprefix + suffix + ".S"
+        objfile = output.fileprefix + suffix + ".o"
+        with open(output.fileprefix + ".S", "rb") as fp:
+            source = fp.read()
+        source = source.replace(b".note.infinity", section)
+        with open(asmfile, "wb") as fp:
+            fp.write(source + b"\n" + PROPERTY_ASM)
+        subprocess.check_call(commands.I8C_CC
+                              + ["-c", asmfile, "-o", objfile])
+        return objfile
+
+    def test_property_notes(self):
+        """Check that other notes with the same type are ignored."""
+        tree, output = self.compile(SOURCE)
+        for suffix, section in (("_property", b".note.infinity"),
+                                ("_renamed", b".note.other")):
+            objfile = self.__reassemble(output, suffix, section)
+            ef = elffile.open(objfile)
+            names = [section.name for section in ef.sections]
+            self.assertIn(".note.gnu.property", names)
+            self.assertEqual(sorted(note.bytes
+                                    for note in ef.infinity_notes),
+                             sorted(note.src.bytes
+                                    for note in output.notes))
+            self.assertEqual(sorted(noteindex.scan([objfile]).keys()),
+                             ["test::func1()i", "test::func2()i"])
+
+    def test_not_elf(self):
+        """Check that files which are not ELF are rejected."""
+        tree, output = self.compile(SOURCE)
+        for contents in (b"", b"\x7fELF", b"#!/bin/sh\n" * 4):
+            filename = output.fileprefix + ".bad"
+            with open(filename, "wb") as fp:
+                fp.write(contents)
+            self.assertRaises(ELFFileError, elffile.open, filename)
+
+    def test_truncated(self):
+        """Check that truncated ELF files are rejected."""
+        tree, output = self.compile(SOURCE)
+        with open(output.fileprefix + ".o", "rb") as fp:
+            contents = fp.read()
+        filename = output.fileprefix + ".bad"
+        with open(filename, "wb") as fp:
+            fp.write(contents[:64])
+        self.assertRaises(ELFFileError, elffile.open, filename)
+
+    def test_note_relocation(self):
+        """Check that relocations in notes are resolved."""
+        tree, output = self.compile(RELOC_SOURCE)
+        with self.memory.builder() as mem:
+            sym = mem.alloc("sym1")
+        self.assertEqual(output.call(output.note.signature), [sym.location])
+
+    def __assemble(self, flags, source=DATA_ASM):
+        tree, output = self.compile(SOURCE)
+        asmfile = output.fileprefix + "_data.S"
+        objfile = output.fileprefix + "_data%s.o" % "".join(flags)
+        with open(asmfile, "wb") as fp:
+            fp.write(source)
+        try:
+            subprocess.check_call(commands.I8C_CC + flags
+                                  + [asmfile, "-o", objfile])
+        except subprocess.CalledProcessError: # pragma: no cover
+            self.skipTest("cannot assemble with %s" % " ".join(flags))
+        return elffile.open(objfile)
+
+    def __check_tables(self, ef, relocoffset, relocname):
+        data = [section for section in ef.sections
+                if section.name == ".data"][0]
+        self.assertEqual(ef.symbol_names(4), ["foo"])
+        self.assertEqual(ef.relocation_at(data.offset + relocoffset),
+                         relocname)
+        self.assertRaises(KeyError, ef.relocation_at, data.offset)
+
+    def test_tables_32(self):
+        """Check symbols and REL relocations in 32-bit files."""
+        ef = self.__assemble(["-m32", "-c"])
+        self.assertEqual(ef.wordsize, 32)
+        self.__check_tables(ef, 8, "foo")
+
+    def test_tables_64(self):
+        """Check symbols and RELA relocations in 64-bit files."""
+        ef = self.__assemble(["-m64", "-c"])
+        self.assertEqual(ef.wordsize, 64)
+        self.__check_tables(ef, 8, "foo+0x0000000000000004")
+
+    def test_addend_names(self):
+        """Check relocation names with addends match objdump's."""
+        ef = self.__assemble(["-m64", "-c"], ADDEND_ASM)
+        data = [section for section in ef.sections
+                if section.name == ".data"][0]
+        output = subprocess.check_output(["objdump", "--reloc",
+                                          ef.filename])
+        expect = {}
+        for line in output.decode("utf-8").split("\n"):
+            fields = line.split()
+            if len(fields) == 3 and fields[1].startswith("R_"):
+                expect[data.offset + int(fields[0], 16)] = fields[2]
+        self.assertEqual(sorted(expect.values()),
+                         ["foo+0x0000000000000008",
+                          "foo-0x0000000000000008"])
+        for offset, name in expect.items():
+            self.assertEqual(ef.relocation_at(offset), name)
+
+    def test_tables_shared(self):
+        """Check relocations in shared libraries."""
+        ef = self.__assemble(["-m64", "-shared", "-fPIC", "-nostdlib"],
+                             SHARED_ASM)
+        data = [section for section in ef.sections
+                if section.name == ".data"][0]
+        self.assertEqual(ef.relocation_at(data.offset + 16),
+                         "foo+0x0000000000000008")
+        self.assertIn("bar", ef.relocations.values())
+        for offset in ef.relocations:
+            self.assertLess(offset, ef.limit)
+
+    def test_slices(self):
+        """Check slices of ELF files."""
+        tree, output = self.compile(SOURCE)
+        ef = elffile.open(output.fileprefix + ".o")
+        note = list(ef.infinity_notes)[0]
+        data = note.bytes
+        self.assertEqual(len(note), len(data))
+        self.assertEqual(bytes(note.memory), data)
+        for index in (0, 1, len(data) - 1, -1):
+            self.assertEqual(ord(note[index]), bytearray(data)[index])
+        self.assertRaises(IndexError, note.__getitem__, len(data))
+        tail = note + 3
+        self.assertEqual(tail.bytes, data[3:])
+        self.assertEqual(tail[:2].bytes, data[3:5])
+        self.assertEqual(tail.find(b"\0"), data[3:].find(b"\0"))
+        self.assertEqual(tail[:2].unpack(b"BB"),
+                         tuple(bytearray(data[3:5])))
+        self.assertRaises(struct.error, tail[:2].unpack, b"BBB")
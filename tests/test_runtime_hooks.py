@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.compat import StringIO
+from i8c.runtime import hooks
+import sys
+
+SOURCE = """\
+define test::double returns int
+    argument int x
+    dup
+    add
+
+define test::quadruple returns int
+    argument int x
+
+    dup
+    bne 0, nonzero
+    return
+
+nonzero:
+    call double
+    call double
+"""
+
+QUADRUPLE = "test::quadruple(i)i"
+
+class EventRecorder(object):
+    def __init__(self):
+        self.events = []
+
+    def on_call(self, ctx, function, stack):
+        self.events.append(("call", function.name))
+
+    def on_return(self, ctx, function, stack):
+        self.events.append(("return", function.name))
+
+class TestRuntimeHooks(TestCase):
+    def test_hooks(self):
+        """Check that execution hooks are called."""
+        tree, output = self.compile(SOURCE)
+        recorder = EventRecorder()
+        output.add_hook(recorder)
+        self.assertEqual(output.operation_hooks, ())
+        self.assertEqual(len(output.call_hooks), 1)
+        self.assertEqual(output.call(QUADRUPLE, 3), [12])
+        self.assertEqual(recorder.events,
+                         [("call", "quadruple"),
+                          ("call", "double"), ("return", "double"),
+                          ("call", "double"), ("return", "double"),
+                          ("return", "quadruple")])
+        output.remove_hook(recorder)
+        self.assertEqual(output.call_hooks, ())
+
+    def test_coverage(self):
+        """Check that the coverage hook counts operations."""
+        tree, output = self.compile(SOURCE)
+        coverage = hooks.CoverageHook()
+        function = output.get_function(QUADRUPLE)
+        output.call(QUADRUPLE, 0)
+        self.assertEqual(coverage.coverage(function)[0], 0)
+        output.add_hook(coverage)
+        output.call(QUADRUPLE, 0)
+        hit, count = coverage.coverage(function)
+        self.assertGreater(hit, 0)
+        self.assertLess(hit, count)
+
+    def test_tracelevel(self):
+        """Check that setting the trace level installs a hook."""
+        tree, output = self.compile(SOURCE)
+        self.assertEqual(output.tracelevel, 0)
+        self.assertEqual(output.operation_hooks, ())
+        output.tracelevel += 1
+        output.tracelevel += 1
+        self.assertEqual(output.tracelevel, 2)
+        self.assertEqual(len(output.operation_hooks), 1)
+        output.tracelevel = 0
+        self.assertEqual(output.operation_hooks, ())
+
+    def test_trace_headers(self):
+        """Check that the trace names the function before every
+        RETURN and before the first operation after a call."""
+        tree, output = self.compile(SOURCE)
+        output.tracelevel = 1
+        saved_stdout = sys.stdout
+        sys.stdout = trace = StringIO()
+        try:
+            self.assertEqual(output.call(QUADRUPLE, 1), [4])
+        finally:
+            sys.stdout = saved_stdout
+        lines = trace.getvalue().split("\n")
+        returns = [index for index, line in enumerate(lines)
+                   if line.endswith(" RETURN")]
+        self.assertEqual(len(returns), 3)
+        for index in returns:
+            self.assertTrue(lines[index - 1].endswith(":"))
+        # The caller's next operation follows a blank line and a
+        # header.
+        self.assertTrue(lines[returns[0] + 2].endswith(":"))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import Context
+from i8c.runtime import CorruptNoteError
+from i8c.runtime.notecache import NoteCache
+
+SOURCE = """\
+define test::callee returns int
+    argument int x
+    add 1
+
+define test::caller returns int
+    argument int x
+    call callee
+    mul 2
+
+define test::unused returns int
+    load 5
+
+define test::empty
+"""
+
+CALLER = "test::caller(i)i"
+CALLEE = "test::callee(i)i"
+
+class TestRuntimeLazy(TestCase):
+    def __import(self, output, note_cache=None):
+        ctx = Context()
+        ctx.lazy_notes = True
+        ctx.note_cache = note_cache
+        ctx.import_notes(output.fileprefix + ".o")
+        return dict((sig, funclist[0])
+                    for sig, funclist in ctx.functions.items()), ctx
+
+    def __check_lazy(self, output, note_cache=None):
+        functions, ctx = self.__import(output, note_cache)
+        self.assertEqual(sorted(functions.keys()),
+                         [CALLEE, CALLER, "test::empty()",
+                          "test::unused()i"])
+        for function in functions.values():
+            self.assertNotIn("ops", function.__dict__)
+        self.assertEqual(ctx.call(CALLER, 5), [12])
+        self.assertIn("ops", functions[CALLER].__dict__)
+        self.assertIn("ops", functions[CALLEE].__dict__)
+        self.assertNotIn("ops", functions["test::unused()i"].__dict__)
+        self.assertFalse(hasattr(functions["test::empty()"], "bytecode"))
+        self.assertEqual(len(functions["test::unused()i"].ops), 1)
+
+    def test_lazy(self):
+        """Check that function bodies are decoded when required."""
+        tree, output = self.compile(SOURCE)
+        self.__check_lazy(output)
+
+    def test_lazy_cached(self):
+        """Check lazy decoding of notes from the note cache."""
+        tree, output = self.compile(SOURCE)
+        cache = NoteCache(output.fileprefix + ".cache")
+        self.__import(output, cache)
+        self.__check_lazy(output, cache)
+        self.assertGreaterEqual(cache.hits, 4)
+
+    def test_lazy_corrupt(self):
+        """Check that a body which fails to decode fails the same
+        way every time it is accessed."""
+        tree, output = self.compile(SOURCE)
+        functions, ctx = self.__import(output)
+        function = functions["test::unused()i"]
+        function.max_stack = 0
+        for attempt in range(2):
+            self.assertRaises(CorruptNoteError, getattr, function, "ops")
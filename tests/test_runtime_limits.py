@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import ExecutionLimitError
+import time
+
+SOURCE = """\
+define test::spin returns int
+    argument int x
+    argument int y
+
+loop:
+    dup
+    beq 0, done
+    sub 1
+    swap
+    add 1
+    swap
+    goto loop
+
+done:
+    drop
+"""
+
+SPIN = "test::spin(ii)i"
+
+class TestRuntimeLimits(TestCase):
+    def test_budget(self):
+        """Check that calls may be limited by operation count."""
+        tree, output = self.compile(SOURCE)
+        self.assertEqual(output.call(SPIN, 0, 10, budget=100), [10])
+        self.assertRaises(ExecutionLimitError,
+                          output.call, SPIN, 0, 10, budget=50)
+        self.assertRaises(ExecutionLimitError,
+                          output.call, SPIN, 0, 100000, budget=10000)
+        output.call_budget = 10000
+        self.assertRaises(ExecutionLimitError,
+                          output.call, SPIN, 0, 100000)
+        self.assertEqual(output.call(SPIN, 0, 100000, budget=None),
+                         [100000])
+
+    def test_deadline(self):
+        """Check that calls may be limited by time."""
+        tree, output = self.compile(SOURCE)
+        self.assertRaises(ExecutionLimitError,
+                          output.call, SPIN, 0, 10000,
+                          deadline=time.time() - 1)
+        output.call_timeout = 0.001
+        self.assertRaises(ExecutionLimitError,
+                          output.call, SPIN, 0, 1 << 62)
+        output.call_timeout = None
+        self.assertEqual(output.call(SPIN, 0, 10), [10])
+
+    def test_translated(self):
+        """Check that limits apply to translatable functions."""
+        tree, output = self.compile(SOURCE)
+        output.translate_notes = True
+        self.assertRaises(ExecutionLimitError,
+                          output.call, SPIN, 0, 100000, budget=10000)
+
+    def test_bad_keyword(self):
+        """Check that unknown keyword arguments are rejected."""
+        tree, output = self.compile(SOURCE)
+        self.assertRaises(TypeError, output.call, SPIN, 0, 1, bugdet=5)
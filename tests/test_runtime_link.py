@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import AmbiguousFunctionError
+from i8c.runtime import UndefinedFunctionError
+
+SOURCE = """\
+define test::increment returns int
+    argument int x
+    add 1
+
+define test::add_two returns int
+    argument int x
+    call increment
+    call increment
+
+define test::sum returns int
+    argument int a
+    argument int b
+    extern func int (int, int) test::add
+    call add
+"""
+
+SUM = "test::sum(ii)i"
+INCREMENT = "test::increment(i)i"
+ADD_TWO = "test::add_two(i)i"
+
+class Adder(object):
+    def call_test_add(self, a, b):
+        return a + b
+
+class TestRuntimeLink(TestCase):
+    def __count_lookups(self, output):
+        self.lookups = 0
+        get_function = output.get_function
+        def counting_get_function(sig_or_ref):
+            self.lookups += 1
+            return get_function(sig_or_ref)
+        output.get_function = counting_get_function
+
+    def test_link(self):
+        """Check that linked externals are not looked up again."""
+        tree, output = self.compile(SOURCE)
+        output.env = Adder()
+        output.link()
+        self.__count_lookups(output)
+        self.assertEqual(output.call(SUM, 2, 3), [5])
+        self.assertEqual(output.call(SUM, 4, 5), [9])
+        self.assertEqual(self.lookups, 2)
+
+    def test_lazy_link(self):
+        """Check that externals are linked the first time they are
+        used when link was not called."""
+        tree, output = self.compile(SOURCE)
+        output.env = Adder()
+        self.__count_lookups(output)
+        self.assertEqual(output.call(SUM, 2, 3), [5])
+        self.assertEqual(output.call(SUM, 4, 5), [9])
+        self.assertEqual(self.lookups, 3)
+
+    def test_env_change(self):
+        """Check that changing the environment discards links."""
+        tree, output = self.compile(SOURCE)
+        output.link()
+        self.assertRaises(UndefinedFunctionError, output.call, SUM, 2, 3)
+        output.env = Adder()
+        self.assertEqual(output.call(SUM, 2, 3), [5])
+
+    def test_register_function(self):
+        """Check that registering a function discards links."""
+        tree, output = self.compile(SOURCE)
+        output.link()
+        self.assertEqual(output.call(ADD_TWO, 5), [7])
+        output.register_function(output.get_function(INCREMENT))
+        self.assertRaises(AmbiguousFunctionError,
+                          output.call, ADD_TWO, 5)
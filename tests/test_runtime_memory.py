@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime.memory import Image, Memory
+from i8c.runtime.testcase import BaseTestCase
+import struct
+try:
+    import unittest2 as unittest
+except ImportError: # pragma: no cover
+    import unittest
+
+class FakeEnv(object):
+    wordsize = 64
+    byteorder = b"<"
+
+class TestRuntimeMemory(TestCase):
+    def test_extents(self):
+        """Check that adjacent writes are merged into one extent."""
+        mem = Memory(FakeEnv())
+        mem.write(0x1010, b"\x05\x06")
+        mem.write(0x1000, b"\x01\x02")
+        mem.write(0x1004, b"\x03")
+        mem.write(0x1002, b"\xaa\xbb")
+        mem.write(0x1005, b"\x04" * 11)
+        self.assertEqual(mem.starts, [0x1000])
+        self.assertEqual(mem.read(0x1000, 18),
+                         b"\x01\x02\xaa\xbb\x03" + b"\x04" * 11 + b"\x05\x06")
+        self.assertEqual(mem.getbyte(0x1011), 6)
+        self.assertRaises(AssertionError, mem.write, 0x0fff, b"\0\0")
+
+    def test_unmapped(self):
+        """Check that reading unmapped memory raises KeyError."""
+        mem = Memory(FakeEnv())
+        mem.write(0x1000, b"\x01\x02\x03\x04")
+        mem.write(0x1008, b"\x01\x02\x03\x04")
+        for location, size, unmapped in ((0x0fff, 2, 0x0fff),
+                                         (0x1002, 4, 0x1004),
+                                         (0x1006, 1, 0x1006),
+                                         (0x100a, 4, 0x100c)):
+            with self.assertRaises(KeyError) as cm:
+                mem.read(location, size)
+            self.assertEqual(cm.exception.args, (unmapped,))
+
+    def test_values(self):
+        """Check that stored values can be read back."""
+        mem = Memory(FakeEnv())
+        with mem.builder() as build:
+            block = build.alloc()
+            block.store_u32(0, 0x12345678)
+            block.store_s16(4, -2)
+        self.assertEqual(mem.read(block.location, 6),
+                         struct.pack(b"<Ih", 0x12345678, -2))
+
+    def test_snapshot(self):
+        """Check that snapshots are unaffected by later writes."""
+        mem = Memory(FakeEnv())
+        mem.write(0x1000, b"\x01\x02")
+        mem.write(0x2000, b"\x03")
+        base = mem.snapshot()
+        self.assertIs(mem.snapshot(), base)
+        fork = Memory(FakeEnv())
+        fork.restore(base)
+        fork.write(0x1002, b"\x04")
+        fork.write(0x3000, b"\x05")
+        mem.write(0x0fff, b"\x06")
+        self.assertEqual(fork.read(0x1000, 3), b"\x01\x02\x04")
+        self.assertRaises(KeyError, fork.read, 0x0fff, 1)
+        self.assertEqual(mem.read(0x0fff, 3), b"\x06\x01\x02")
+        self.assertRaises(KeyError, mem.read, 0x1002, 1)
+        mem.restore(base)
+        self.assertEqual(mem.read(0x1000, 2), b"\x01\x02")
+        self.assertRaises(KeyError, mem.read, 0x0fff, 1)
+        self.assertRaises(KeyError, mem.read, 0x3000, 1)
+        # The snapshot's extents are shared, not copied.
+        self.assertIs(mem.extents[1], fork.extents[1])
+
+    def test_base_image(self):
+        """Check that tests start with a copy of the base image."""
+        class ImageTest(BaseTestCase):
+            wordsize = 64
+            byteorder = b"<"
+
+            @classmethod
+            def setUpClass(cls):
+                cls.base_image = Image(64, b"<")
+                with cls.base_image.builder() as build:
+                    build.alloc("base").store_u32(0, 7)
+
+            def test_one(self):
+                self.check()
+
+            def test_two(self):
+                self.check()
+
+            def check(self):
+                location = self.lookup_symbol("base")
+                self.assertEqual(self.read_memory(b"<I", location),
+                                 struct.pack(b"<I", 7))
+                with self.memory.builder() as build:
+                    build.alloc("extra").store_u32(0, 8)
+                extra = self.lookup_symbol("extra")
+                self.assertGreater(extra, location)
+                self.assertEqual(self.read_memory(b"<I", extra),
+                                 struct.pack(b"<I", 8))
+
+        result = unittest.TestResult()
+        unittest.defaultTestLoader.loadTestsFromTestCase(ImageTest).run(
+            result)
+        self.assertEqual((result.testsRun, result.errors, result.failures),
+                         (2, [], []))
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import Context
+from i8c.runtime.notecache import NoteCache
+import marshal
+import os
+import shutil
+
+SOURCE = """\
+define test::max returns int
+    argument int a
+    argument int b
+
+    pick 1
+    pick 1
+    blt smaller
+    drop
+    return
+
+smaller:
+    swap
+    drop
+
+define test::sum returns int
+    argument int a
+    argument int b
+    extern func int (int, int) test::add
+    call add
+
+define test::empty
+"""
+
+MAX = "test::max(ii)i"
+SUM = "test::sum(ii)i"
+
+class Adder(object):
+    def call_test_add(self, a, b):
+        return a + b
+
+class TestRuntimeNoteCache(TestCase):
+    def __cachedir(self, output):
+        cachedir = output.fileprefix + ".cache"
+        if os.path.exists(cachedir):
+            shutil.rmtree(cachedir)
+        return cachedir
+
+    def __contexts(self):
+        tree, output = self.compile(SOURCE)
+        cache = NoteCache(self.__cachedir(output))
+        for expect_hits in (False, True):
+            ctx = Context()
+            ctx.note_cache = cache
+            ctx.import_notes(output.fileprefix + ".o")
+            yield ctx, expect_hits
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+
+    def test_notecache(self):
+        """Check that decoded notes are cached."""
+        results = []
+        for ctx, expect_hits in self.__contexts():
+            funcs = sorted((sig, funclist[0].decoded)
+                           for sig, funclist in ctx.functions.items())
+            self.assertEqual(len(funcs), 3)
+            results.append(funcs)
+            ctx.env = Adder()
+            for a, b in ((3, 7), (7, 3)):
+                self.assertEqual(ctx.call(MAX, a, b), [7])
+                self.assertEqual(ctx.call(SUM, a, b), [10])
+        self.assertEqual(results[0], results[1])
+
+    def test_corrupt_entry(self):
+        """Check that unreadable cache entries are ignored."""
+        tree, output = self.compile(SOURCE)
+        cachedir = self.__cachedir(output)
+        cache = NoteCache(cachedir)
+        ctx = Context()
+        ctx.note_cache = cache
+        ctx.import_notes(output.fileprefix + ".o")
+        for dir, subdirs, files in os.walk(cachedir):
+            for name in files:
+                with open(os.path.join(dir, name), "wb") as fp:
+                    fp.write(b"garbage")
+        ctx = Context()
+        ctx.note_cache = cache
+        ctx.import_notes(output.fileprefix + ".o")
+        self.assertEqual(cache.hits, 0)
+        self.assertEqual(ctx.call(MAX, 3, 7), [7])
+
+    def test_marshal_version(self):
+        """Check that entries written with another marshal format
+        are not read."""
+        tree, output = self.compile(SOURCE)
+        cachedir = self.__cachedir(output)
+        saved_version = marshal.version
+        marshal.version = saved_version + 1
+        try:
+            cache = NoteCache(cachedir)
+        finally:
+            marshal.version = saved_version
+        ctx = Context()
+        ctx.note_cache = cache
+        ctx.import_notes(output.fileprefix + ".o")
+        cache = NoteCache(cachedir)
+        ctx = Context()
+        ctx.note_cache = cache
+        ctx.import_notes(output.fileprefix + ".o")
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import Context
+from i8c.runtime import ELFFileError
+from i8c.runtime import noteindex
+import os
+
+# The second file's functions call a function defined in the first.
+SOURCES = ("""\
+define test::double returns int
+    argument int x
+    dup
+    add
+""", """\
+define test::quadruple returns int
+    argument int x
+    extern func int (int) test::double
+    call double
+    call double
+
+define test::octuple returns int
+    argument int x
+    extern func int (int) test::double
+    call quadruple
+    call double
+""")
+
+SIGNATURES = ["test::double(i)i", "test::octuple(i)i",
+              "test::quadruple(i)i"]
+
+class TestRuntimeNoteIndex(TestCase):
+    def __objfiles(self):
+        return [self.compile(source)[1].fileprefix + ".o"
+                for source in SOURCES]
+
+    def test_import_many(self):
+        """Check that import_many imports and indexes every note."""
+        objfiles = self.__objfiles()
+        indexes = []
+        for jobs in (1, 2):
+            ctx = Context()
+            index = ctx.import_many(objfiles, jobs)
+            self.assertEqual(sorted(ctx.functions.keys()), SIGNATURES)
+            self.assertEqual(ctx.call("test::quadruple(i)i", 3), [12])
+            self.assertEqual(ctx.call("test::octuple(i)i", 3), [24])
+            indexes.append(index)
+        self.assertEqual(indexes[0], indexes[1])
+        index = indexes[0]
+        self.assertEqual(sorted(index.keys()), SIGNATURES)
+        for signature, locations in index.items():
+            self.assertEqual(len(locations), 1)
+            filename, offset = locations[0]
+            self.assertIn(filename, map(os.path.abspath, objfiles))
+            function = ctx.get_function(signature)
+            self.assertEqual((os.path.abspath(function.src.filename),
+                              function.src.start),
+                             (filename, offset))
+
+    def test_save_load(self):
+        """Check that indexes may be saved and loaded."""
+        objfiles = self.__objfiles()
+        index = Context().import_many(objfiles, 1)
+        filename = os.path.splitext(objfiles[0])[0] + ".index"
+        noteindex.save(index, filename)
+        self.assertEqual(noteindex.load(filename), index)
+
+    def test_bad_file(self):
+        """Check that errors in worker processes are reported."""
+        objfiles = self.__objfiles()
+        with open(objfiles[0], "wb") as fp:
+            fp.write(b"not an ELF file")
+        for jobs in (1, 2):
+            self.assertRaises(ELFFileError,
+                              Context().import_many, objfiles, jobs)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime.profiler import Profiler
+import json
+
+SOURCE = """\
+define test::cube returns int
+    argument int x
+    dup
+    dup
+    mul
+    mul
+
+define test::sum_cubes returns int
+    argument int x
+
+    load 0
+    swap
+    goto check
+
+loop:
+    dup
+    call cube
+    rot
+    rot
+    add
+    swap
+    sub 1
+
+check:
+    dup
+    bne 0, loop
+    drop
+"""
+
+CUBE = "test::cube(i)i"
+SUM_CUBES = "test::sum_cubes(i)i"
+
+class TestRuntimeProfiler(TestCase):
+    def test_profile(self):
+        """Check that execution is profiled."""
+        tree, output = self.compile(SOURCE)
+        profile = output.start_profiling()
+        self.assertIs(output.start_profiling(), profile)
+        self.assertEqual(output.call(SUM_CUBES, 3), [36])
+        self.assertIs(output.stop_profiling(), profile)
+        self.assertIs(output.stop_profiling(), None)
+        self.assertEqual(output.call(SUM_CUBES, 3), [36])
+
+        self.assertEqual(profile.functions[CUBE]["calls"], 3)
+        stats = profile.functions[SUM_CUBES]
+        self.assertEqual(stats["calls"], 1)
+        self.assertGreater(stats["instructions"],
+                           len(output.get_function(SUM_CUBES).ops))
+        # Time spent in cube counts towards sum_cubes' cumulative
+        # time but not its own.
+        self.assertGreaterEqual(stats["cumulative"], 0)
+        self.assertLessEqual(stats["self"], stats["cumulative"] + 1e-6)
+        instructions = sum(stats["instructions"]
+                           for stats in profile.functions.values())
+        self.assertEqual(sum(profile.opcodes.values()), instructions)
+        self.assertEqual(sum(profile.locations.values()), instructions)
+        # The first operation is executed once per call.
+        first = sorted(count for (sig, pc, name), count
+                       in profile.locations.items() if pc == 0)
+        self.assertEqual(first, [1, 3])
+
+    def test_merge(self):
+        """Check that profiles may be exported and merged."""
+        tree, output = self.compile(SOURCE)
+        profile = output.start_profiling()
+        output.call(SUM_CUBES, 4)
+        exported = json.loads(profile.as_json())
+        merged = Profiler()
+        merged.merge(exported)
+        merged.merge(exported)
+        self.assertEqual(merged.functions[CUBE]["calls"], 8)
+        self.assertEqual(merged.functions[SUM_CUBES]["instructions"],
+                         2 * profile.functions[SUM_CUBES]["instructions"])
+        self.assertEqual(merged.opcodes,
+                         dict((name, 2 * count) for name, count
+                              in profile.opcodes.items()))
+        table = merged.format_table()
+        self.assertIn(SUM_CUBES, table)
+        self.assertIn("mul", table)
+        # Locations are shown as in traces.
+        pc = max(pc for (sig, pc, name) in merged.locations)
+        self.assertGreater(pc, 9)
+        self.assertIn("%s+%04x" % (SUM_CUBES, pc), table)
+
+    def test_tracelevel(self):
+        """Check that tracing does not affect profiling."""
+        tree, output = self.compile(SOURCE)
+        profile = output.start_profiling()
+        output.tracelevel = 1
+        output.tracelevel = 0
+        self.assertIs(output.start_profiling(), profile)
+        self.assertEqual(output.call(SUM_CUBES, 3), [36])
+        self.assertIs(output.stop_profiling(), profile)
+        self.assertEqual(profile.functions[CUBE]["calls"], 3)
+        self.assertEqual(output.call_hooks, ())
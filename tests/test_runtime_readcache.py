@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import BadDerefError
+from i8c.runtime.readcache import ReadCache
+
+SOURCE = """\
+define test::list_sum returns int
+    argument ptr node
+    load 0
+loop:
+    swap
+    dup
+    load NULL
+    beq done
+    dup
+    add 8
+    deref u64
+    swap
+    rot
+    add
+    swap
+    deref ptr
+    swap
+    goto loop
+done:
+    drop
+"""
+
+class TestRuntimeReadCache(TestCase):
+    def __build_list(self, length):
+        tree, output = self.compile(SOURCE)
+        with self.memory.builder() as mem:
+            nodes = [mem.alloc() for i in range(length)]
+            for index, node in enumerate(nodes):
+                if index + 1 < length:
+                    node.store_ptr(0, nodes[index + 1])
+                else:
+                    node.store_ptr(0, None)
+                node.store_u64(8, index + 1)
+        return output, nodes[0].location
+
+    def test_read_cache(self):
+        """Check that memory is read a page at a time."""
+        output, head = self.__build_list(5)
+        cache = output.read_cache = ReadCache(pagesize=16,
+                                              per_call=False)
+        self.assertEqual(output.call(output.note.signature, head), [15])
+        self.assertEqual((cache.hits, cache.misses), (5, 5))
+        self.assertEqual(len(cache), 5)
+        self.assertEqual(output.call(output.note.signature, head), [15])
+        self.assertEqual((cache.hits, cache.misses), (15, 5))
+        self.assertEqual(cache.hit_rate, 0.75)
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+    def test_per_call(self):
+        """Check that the cache may be invalidated for every call."""
+        output, head = self.__build_list(5)
+        cache = output.read_cache = ReadCache(pagesize=16, maxpages=2)
+        for x in range(2):
+            self.assertEqual(output.call(output.note.signature, head),
+                             [15])
+        self.assertEqual((cache.hits, cache.misses), (10, 10))
+        self.assertEqual(len(cache), 2)
+
+    def test_default_pagesize(self):
+        """Check that pages of test memory are cached in parts."""
+        output, head = self.__build_list(3)
+        cache = output.read_cache = ReadCache(per_call=False)
+        self.assertEqual(output.call(output.note.signature, head), [6])
+        self.assertEqual((cache.hits, cache.misses), (1, 5))
+        self.assertEqual(output.call(output.note.signature, head), [6])
+        self.assertEqual((cache.hits, cache.misses), (7, 5))
+        self.assertEqual(len(cache), 1)
+
+    def test_fallback(self):
+        """Check that unmapped memory is read uncached."""
+        output, head = self.__build_list(3)
+        cache = output.read_cache = ReadCache()
+        self.assertRaises(BadDerefError,
+                          output.call, output.note.signature, head - 8)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import Context
+from i8c.runtime import UndefinedFunctionError
+from i8c.runtime import noteindex
+import os
+import shutil
+
+SOURCES = ("""\
+define test::double returns int
+    argument int x
+    dup
+    add
+
+define test::unused returns int
+    load 0
+""", """\
+define test::quadruple returns int
+    argument int x
+    extern func int (int) test::double
+    load double
+    call
+    load double
+    call
+""")
+
+class TestRuntimeSearchPath(TestCase):
+    def __library(self):
+        """Compile SOURCES into a directory of their own, returning
+        its name."""
+        objfiles = [self.compile(source)[1].fileprefix + ".o"
+                    for source in SOURCES]
+        libdir = os.path.splitext(objfiles[0])[0] + ".lib"
+        if os.path.exists(libdir):
+            shutil.rmtree(libdir)
+        os.makedirs(libdir)
+        for objfile in objfiles:
+            shutil.copy(objfile, libdir)
+        with open(os.path.join(libdir, "README"), "w") as fp:
+            fp.write("not an ELF file\n")
+        return libdir
+
+    def __check_loading(self, ctx):
+        self.assertEqual(ctx.functions, {})
+        self.assertEqual(ctx.call("test::quadruple(i)i", 5), [20])
+        self.assertEqual(sorted(ctx.functions.keys()),
+                         ["test::double(i)i", "test::quadruple(i)i"])
+        self.assertRaises(UndefinedFunctionError,
+                          ctx.get_function, "test::missing()")
+
+    def test_search_path(self):
+        """Check that functions are loaded from the search path."""
+        ctx = Context()
+        ctx.search_path = [self.__library()]
+        self.__check_loading(ctx)
+
+    def test_prebuilt_index(self):
+        """Check that a saved index with relative filenames works."""
+        libdir = self.__library()
+        index = noteindex.scan([libdir])
+        self.assertEqual(len(index), 3)
+        index = dict((signature, [(os.path.basename(filename), offset)
+                                  for filename, offset in locations])
+                     for signature, locations in index.items())
+        indexfile = libdir + ".index"
+        noteindex.save(index, indexfile)
+        ctx = Context()
+        ctx.search_path = [libdir]
+        ctx.note_index = noteindex.load(indexfile)
+        self.__check_loading(ctx)
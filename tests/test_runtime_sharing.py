@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import Context
+from i8c.runtime import hooks
+from multiprocessing.pool import ThreadPool
+
+SOURCE = """\
+define test::apply returns int
+    argument int a
+    argument int b
+    extern func int (int, int) test::op
+    call op
+"""
+
+APPLY = "test::apply(ii)i"
+
+class Adder(object):
+    def call_test_op(self, a, b):
+        return a + b
+
+class Multiplier(object):
+    def call_test_op(self, a, b):
+        return a * b
+
+class TestRuntimeSharing(TestCase):
+    def __contexts(self, output, envs):
+        """Return a context for each of ENVS, all sharing the
+        lazily decoded functions of one context."""
+        source = Context()
+        source.lazy_notes = True
+        source.import_notes(output.fileprefix + ".o")
+        result = []
+        for env in envs:
+            ctx = Context()
+            ctx.wordsize = source.wordsize
+            ctx.byteorder = source.byteorder
+            for funclist in source.functions.values():
+                for function in funclist:
+                    ctx.register_function(function)
+            ctx.env = env
+            result.append(ctx)
+        return result
+
+    def test_sharing(self):
+        """Check that contexts may share decoded functions."""
+        tree, output = self.compile(SOURCE)
+        adder, multiplier = self.__contexts(output,
+                                            (Adder(), Multiplier()))
+        coverage = hooks.CoverageHook()
+        adder.add_hook(coverage)
+        self.assertIs(adder.get_function(APPLY),
+                      multiplier.get_function(APPLY))
+        self.assertEqual(multiplier.call(APPLY, 3, 4), [12])
+        self.assertEqual(coverage.coverage(adder.get_function(APPLY)),
+                         (0, 2))
+        self.assertEqual(adder.call(APPLY, 3, 4), [7])
+        self.assertEqual(multiplier.call(APPLY, 3, 4), [12])
+        self.assertEqual(coverage.coverage(adder.get_function(APPLY)),
+                         (2, 2))
+
+    def test_threads(self):
+        """Check that shared functions may be used by many threads."""
+        tree, output = self.compile(SOURCE)
+        contexts = self.__contexts(output, [Adder(), Multiplier()] * 4)
+        def run(ctx):
+            return [ctx.call(APPLY, x, 3)[0] for x in range(100)]
+        pool = ThreadPool(len(contexts))
+        try:
+            results = pool.map(run, contexts)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(results,
+                         [[x + 3 for x in range(100)],
+                          [x * 3 for x in range(100)]] * 4)
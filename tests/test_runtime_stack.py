@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import Context
+from i8c.runtime import CorruptNoteError
+from i8c.runtime import StackOverflowError
+from i8c.runtime import stack
+from i8c.runtime import types
+
+SOURCE = """\
+define test::count returns int
+    argument int x
+    load 0
+    swap
+
+loop:
+    dup
+    beq 0, done
+    sub 1
+    swap
+    add 1
+    swap
+    goto loop
+
+done:
+    drop
+"""
+
+SIGNATURE = "test::count(i)i"
+
+STRAIGHT_SOURCE = """\
+define test::times4 returns int
+    argument int x
+    dup
+    dup
+    dup
+    add
+    add
+    add
+"""
+
+class TestRuntimeStack(TestCase):
+    def test_wrapping(self):
+        """Check that the runtime stack wraps integers."""
+        for wordsize in (32, 64):
+            s = stack.Stack(wordsize)
+            s.push_intptr(-1)
+            s.push_intptr(1 << wordsize)
+            s.push_intptr(1 << (wordsize - 1))
+            self.assertEqual(s.pop_signed(), -(1 << (wordsize - 1)))
+            self.assertEqual(s.pop_unsigned(), 0)
+            self.assertEqual(s.pop_unsigned(), (1 << wordsize) - 1)
+            self.assertEqual(s.slots, [])
+
+    def test_manipulation(self):
+        """Check the runtime stack's manipulation operations."""
+        s = stack.Stack(32)
+        for value in (1, 2, 3):
+            s.push_intptr(value)
+        s.pick(2)
+        self.assertEqual(s.slots, [1, 2, 3, 1])
+        s.rot()
+        self.assertEqual(s.slots, [1, 1, 2, 3])
+        s.swap()
+        self.assertEqual(s.slots, [1, 1, 3, 2])
+        s.drop()
+        self.assertEqual(s.slots, [1, 1, 3])
+        self.assertRaises(IndexError, s.pick, 3)
+
+    def test_typed(self):
+        """Check the runtime stack handles non-integer values."""
+        s = stack.Stack(64)
+        s.push_multi((types.IntegerType, types.OpaqueType),
+                     (-5, "hello"))
+        self.assertIsInstance(s.slots[0], stack.Opaque)
+        self.assertEqual(s.slots[1], (1 << 64) - 5)
+        self.assertEqual(s.pop_multi((types.IntegerType,
+                                      types.OpaqueType)),
+                         [(1 << 64) - 5, "hello"])
+
+    def test_pool(self):
+        """Check that the context reuses released stacks."""
+        tree, output = self.compile(SOURCE)
+        s = output.acquire_stack()
+        s.push_intptr(1)
+        output.release_stack(s)
+        self.assertIs(output.acquire_stack(), s)
+        self.assertEqual(s.slots, [])
+        self.assertIsNot(output.acquire_stack(), s)
+
+    def test_max_stack(self):
+        """Check that exceeding max_stack is reported."""
+        tree, output = self.compile(SOURCE)
+        function = output.get_function(SIGNATURE)
+        self.assertEqual(function.max_stack, 4)
+        self.assertEqual(output.call(SIGNATURE, 5), [5])
+        function.max_stack = 1
+        function.verification = None
+        self.assertRaises(CorruptNoteError, output.call, SIGNATURE, 5)
+
+    def test_max_stack_straight_line(self):
+        """Check that exceeding max_stack without branching is
+        reported."""
+        tree, output = self.compile(STRAIGHT_SOURCE)
+        ctx = Context()
+        ctx.lazy_notes = True
+        ctx.import_notes(output.fileprefix + ".o")
+        function = ctx.get_function("test::times4(i)i")
+        self.assertEqual(function.max_stack, 4)
+        function.max_stack = 2
+        self.assertRaises(StackOverflowError,
+                          ctx.call, "test::times4(i)i", 3)
+
+    def test_max_stack_unverified(self):
+        """Check that exceeding max_stack is reported in unverified
+        functions whose stack shrinks again before they return."""
+        tree, output = self.compile(STRAIGHT_SOURCE)
+        function = output.get_function("test::times4(i)i")
+        self.assertEqual(output.call("test::times4(i)i", 3), [12])
+        function.max_stack = 2
+        function.verification = None
+        self.assertRaises(StackOverflowError,
+                          output.call, "test::times4(i)i", 3)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import ExecutionLimitError
+import sys
+
+SOURCE_LOOP = """\
+define test::factorial returns int
+    argument int x
+
+    load 1
+    swap
+    goto check
+
+loop:
+    dup
+    rot
+    mul
+    swap
+    load 1
+    sub
+
+check:
+    dup
+    load 1
+    bgt loop
+    drop
+"""
+
+SOURCE_RECURSION = """\
+define test::triangle returns int
+    argument int x
+
+    dup
+    bne 0, recurse
+    return
+
+recurse:
+    dup
+    sub 1
+    call triangle
+    add
+"""
+
+SOURCE_MATH = """\
+define test::math returns int, int, int, int, int, int, int
+    argument int a
+    argument int b
+
+    pick 1
+    pick 1
+    div
+    pick 2
+    pick 2
+    shra
+    pick 3
+    neg
+    pick 4
+    abs
+    pick 5
+    not
+    pick 6
+    pick 6
+    sub
+    pick 7
+    pick 7
+    blt smaller
+    load 0
+    goto done
+smaller:
+    load 1
+done:
+"""
+
+SOURCE_DEREF = """\
+define test::deref returns int
+    extern ptr sym1
+    deref sym1, s16
+    add 5
+"""
+
+# Casting O to int hides that the slot merged at "done" is opaque on
+# one path and an integer on the other, which the compiler accepts
+# but the verifier, and so the translator, cannot.
+SOURCE_UNVERIFIABLE = """\
+define test::fallback returns int
+    argument int x
+    argument opaque o
+    cast o, int
+    load x
+    beq 0, zero
+    load o
+    goto done
+zero:
+    load x
+done:
+    drop
+    drop
+    add 1
+"""
+
+class TestRuntimeTranslator(TestCase):
+    def __check(self, source, signature, inputs, output=None):
+        if output is None:
+            tree, output = self.compile(source)
+        self.assertIsNot(output.note.pycode, None)
+        for args in inputs:
+            output.translate_notes = False
+            expect = output.call(signature, *args)
+            output.translate_notes = True
+            self.assertEqual(output.call(signature, *args), expect)
+
+    def test_loop(self):
+        """Check that translated loops work."""
+        self.__check(SOURCE_LOOP, "test::factorial(i)i",
+                     ((x,) for x in range(13)))
+
+    def test_recursion(self):
+        """Check that translated recursive functions work."""
+        self.__check(SOURCE_RECURSION, "test::triangle(i)i",
+                     ((x,) for x in range(100)))
+
+    def test_deep_recursion(self):
+        """Check that translated recursion is not limited by Python's
+        stack, but by the context's call depth limit."""
+        tree, output = self.compile(SOURCE_RECURSION)
+        output.translate_notes = True
+        depth = sys.getrecursionlimit() * 2
+        self.assertEqual(output.call("test::triangle(i)i", depth),
+                         [depth * (depth + 1) // 2])
+        output.call_depth_limit = 10
+        self.assertRaises(ExecutionLimitError,
+                          output.call, "test::triangle(i)i", 11)
+        self.assertEqual(output.call_depth, 0)
+
+    def test_math(self):
+        """Check that translated arithmetic wraps correctly."""
+        values = (0, 1, 2, 7, -1, -3, -0x80000000, 0x7fffffff)
+        self.__check(SOURCE_MATH, "test::math(ii)iiiiiii",
+                     ((a, b) for a in values for b in values
+                      if b not in (0, -1, -3, -0x80000000)))
+
+    def test_deref(self):
+        """Check that translated functions can access memory."""
+        tree, output = self.compile(SOURCE_DEREF)
+        with self.memory.builder() as mem:
+            sym = mem.alloc("sym1")
+            sym.store_s16(0, -7)
+        self.__check(SOURCE_DEREF, "test::deref()i", ((),), output)
+
+    def test_untranslatable(self):
+        """Check that untranslatable functions use the interpreter."""
+        tree, output = self.compile(SOURCE_UNVERIFIABLE)
+        self.assertIs(output.note.verification, None)
+        self.assertIs(output.note.pycode, None)
+        for x in (0, 3):
+            output.translate_notes = False
+            expect = output.call("test::fallback(io)i", x, "hello")
+            self.assertEqual(expect, [x + 1])
+            output.translate_notes = True
+            self.assertIs(output.pycode_for(output.note), None)
+            self.assertEqual(output.call("test::fallback(io)i", x, "hello"),
+                             expect)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import ExecutionLimitError
+from i8c.runtime import vector
+try:
+    import unittest2 as unittest
+except ImportError: # pragma: no cover
+    import unittest
+
+SOURCE = """\
+define test::math returns int, int, int, int, int, int, int, int, int
+    argument int a
+    argument int b
+
+    pick 1
+    pick 1
+    div
+    pick 2
+    pick 2
+    shra
+    pick 3
+    pick 3
+    shl
+    pick 4
+    neg
+    pick 5
+    abs
+    pick 6
+    not
+    pick 7
+    pick 7
+    sub
+    pick 8
+    pick 8
+    mod
+    pick 9
+    pick 9
+    lt
+"""
+
+SIGNATURE = "test::math(ii)iiiiiiiii"
+
+NO_RETURNS_SOURCE = """\
+define test::discard
+    argument int a
+    argument int b
+
+    add
+    drop
+"""
+
+NO_RETURNS_SIGNATURE = "test::discard(ii)"
+
+VALUES = (0, 1, 2, 7, 63, 64, 65, -1, -3, -0x8000000000000000,
+          0x7fffffffffffffff, 0x123456789abcdef)
+
+class TestRuntimeVector(TestCase):
+    @unittest.skipIf(vector.numpy is None, "NumPy is not installed")
+    def test_vector(self):
+        """Check lane-parallel evaluation matches the interpreter."""
+        tree, output = self.compile(SOURCE)
+        self.assertTrue(vector.is_vectorizable(output.note))
+        rows = [(a, b) for a in VALUES for b in VALUES if 0 < b < 100]
+        results = vector.call_many(output.note, rows)
+        self.assertIsNot(results, None)
+        self.assertEqual(results,
+                         [output.call(SIGNATURE, *args) for args in rows])
+
+    def test_no_returns(self):
+        """Check call_many returns an empty list for every call to
+        a function that returns nothing."""
+        tree, output = self.compile(NO_RETURNS_SOURCE)
+        self.assertTrue(vector.is_vectorizable(output.note))
+        rows = [(1, 2), (3, 4), (5, 6)]
+        self.assertEqual(output.call_many(NO_RETURNS_SIGNATURE, rows),
+                         [[] for args in rows])
+        self.assertEqual(output.call_many(NO_RETURNS_SIGNATURE, rows),
+                         [output.call(NO_RETURNS_SIGNATURE, *args)
+                          for args in rows])
+
+    def test_fallback(self):
+        """Check call_many falls back to the interpreter."""
+        tree, output = self.compile(SOURCE)
+        # Division by zero cannot be evaluated lanewise.
+        self.assertIs(vector.call_many(output.note, [(1, 0)]), None)
+        rows = [(5, 3), (-7, 2)]
+        self.assertEqual(output.call_many(SIGNATURE, rows),
+                         [output.call(SIGNATURE, *args) for args in rows])
+
+    def test_limits(self):
+        """Check call_many enforces limits on every call."""
+        tree, output = self.compile(SOURCE)
+        rows = [(5, 3), (-7, 2)]
+        self.assertRaises(ExecutionLimitError,
+                          output.call_many, SIGNATURE, rows, budget=5)
+        output.call_budget = 5
+        self.assertRaises(ExecutionLimitError,
+                          output.call_many, SIGNATURE, rows)
+        self.assertEqual(output.call_many(SIGNATURE, rows, budget=None),
+                         [output.call(SIGNATURE, *args, budget=None)
+                          for args in rows])
+
+    def test_unexpected_keyword(self):
+        """Check call_many rejects keywords call does not accept."""
+        tree, output = self.compile(SOURCE)
+        rows = [(5, 3), (-7, 2)]
+        self.assertRaises(TypeError,
+                          output.call_many, SIGNATURE, rows, budgett=5)
+        output.call_budget = 5
+        self.assertRaises(TypeError,
+                          output.call_many, SIGNATURE, rows, budgett=5)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2015-16 Red Hat, Inc.
+# This file is part of the Infinity Note Compiler.
+#
+# The Infinity Note Compiler is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# The Infinity Note Compiler is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the Infinity Note Compiler.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from tests import TestCase
+from i8c.runtime import Context
+from i8c.runtime import CorruptNoteError
+from i8c.runtime import StackOverflowError
+from i8c.runtime import types
+from i8c.runtime import verifier
+
+# The loop's back edge merges the stack states of two paths.
+SOURCE = """\
+define test::sum_to returns int
+    argument int x
+
+    load 0
+    swap
+    goto check
+
+loop:
+    dup
+    rot
+    add
+    swap
+    sub 1
+
+check:
+    dup
+    bne 0, loop
+    drop
+
+define test::apply returns int
+    argument func int (int) f
+    argument int x
+    load f
+    call
+
+define test::empty
+"""
+
+SUM_TO = "test::sum_to(i)i"
+
+class TestRuntimeVerifier(TestCase):
+    def test_verified(self):
+        """Check that compiled functions pass verification."""
+        tree, output = self.compile(SOURCE)
+        function = output.get_function(SUM_TO)
+        result = function.verification
+        self.assertIsNot(result, None)
+        # The compiler's estimate may exceed the optimized code's.
+        self.assertEqual(result.max_depth, 3)
+        self.assertLessEqual(result.max_depth, function.max_stack)
+        self.assertEqual(result.states[0], (verifier.INT,))
+        self.assertIsNot(output.get_function("test::apply(Fi(i)i)i")
+                         .verification, None)
+        self.assertIs(output.get_function("test::empty()").verification,
+                      None)
+        self.assertEqual(output.call(SUM_TO, 5), [15])
+
+    def test_bad_jump(self):
+        """Check that control must land on instruction boundaries."""
+        tree, output = self.compile(SOURCE)
+        function = output.get_function(SUM_TO)
+        for pc in sorted(function.ops)[1:]:
+            op = function.ops.pop(pc)
+            self.assertIs(verifier.verify(function), None)
+            function.ops[pc] = op
+        self.assertIsNot(verifier.verify(function), None)
+
+    def test_max_stack(self):
+        """Check that exceeding the note's max_stack is rejected."""
+        tree, output = self.compile(SOURCE)
+        ctx = Context()
+        ctx.lazy_notes = True
+        ctx.import_notes(output.fileprefix + ".o")
+        function = ctx.get_function(SUM_TO)
+        function.max_stack = 2
+        self.assertRaises(StackOverflowError, getattr,
+                          function, "verification")
+
+    def test_return_types(self):
+        """Check that returning values other than the function's
+        return types is rejected."""
+        tree, output = self.compile(SOURCE)
+        function = output.get_function(SUM_TO)
+        for rtypes in ([types.OpaqueType],
+                       [types.IntegerType, types.IntegerType]):
+            function.rtypes = rtypes
+            self.assertRaises(CorruptNoteError, verifier.verify, function)
+        function.rtypes = [types.PointerType]
+        self.assertIsNot(verifier.verify(function), None)